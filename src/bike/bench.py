@@ -0,0 +1,70 @@
+# gwmg.bike.bench.py
+
+"""
+Times a scaled down movie, a few frames out of each act, on synthetic
+sources made under --sources (a temp dir by default), at --size
+results go in the same baseline as gwmg/bench.py's
+    python bench.py [--size 360x240] [--frames 8] [--baseline bench.json]
+                    [--save] [--threshold 0.25]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from gwmg import bench
+from gwmg import output
+
+# frames worth timing in each act, (first frame, label)
+WINDOWS = ((40, "title"), (1300, "act1"), (4800, "act2"), (7500, "act3"), \
+            (7860, "act3 collapse"), (7900, "the_end"))
+
+def sources(root, count=24):
+    "the bike_sources tree, made up"
+    sources = os.path.join(root, "bike_sources")
+    sequences = (("bike_frames/bike1_%04d.png", 1), ("behbike_frames/behbike%04d.png", 2), \
+                ("treemask/treemaskin %04d.jpg", 3), ("fountain_frames/fountain%04d.png", 4), \
+                ("automotion/automotionin %04d.jpg", 5))
+    for pattern, seed in sequences:
+        pattern = os.path.join(sources, pattern)
+        if not os.path.exists(pattern % count):
+            bench.makeSequence(pattern, count, seed * 1000)
+    images = (("sun.png", 6), ("scene.JPG", 7), ("credits.png", 8), ("title.png", 9))
+    for name, seed in images:
+        path = os.path.join(sources, "images", name)
+        if not os.path.exists(path):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            bench.makeImage(bench.SOURCE_SIZE, seed).save(path)
+
+def benchMovie(frames=8, repeat=2, verbose=True):
+    "{'movie label WxH': ms a frame}, settings have to point at the sources"
+    import movie
+    results = {}
+    for first, label in WINDOWS:
+        best = None
+        for run in range(repeat):
+            maker = movie.Maker((first, first + frames - 1), None, movie.SIZE, \
+                        verbose=False, sink=output.FrameSink())
+            started = time.time()
+            maker.make()
+            elapsed = 1000 * (time.time() - started) / frames
+            if best is None or elapsed < best:
+                best = elapsed
+        key = "movie %s %dx%d" % ((label,) + tuple(movie.SIZE))
+        results[key] = best
+        if verbose:
+            print "%-50s %8.2fms" % (key, best)
+    return results
+
+if __name__ == '__main__':
+    opts = bench.options(sys.argv[1:], {"size": "360x240", "frames": "8", "repeat": "2", \
+                "baseline": "bench.json", "threshold": "0.25", "sources": "", "save": False})
+    root = opts["sources"] or os.path.join(tempfile.gettempdir(), "gwmg-bench-bike")
+    sources(root)
+    # settings read these when movie is imported
+    os.environ["GWMG_ROOT"] = root + "/"
+    os.environ["GWMG_SIZE"] = opts["size"]
+    results = benchMovie(int(opts["frames"]), int(opts["repeat"]))
+    sys.exit(bench.report(results, opts["baseline"], float(opts["threshold"]), \
+                opts["save"]) and 1 or 0)
@@ -0,0 +1,26 @@
+# gwmg.bike.ingest.py
+
+"""
+Decodes and fits the source sequences to SIZE once, into proxies
+under PROXY_ROOT that the providers read from instead
+run it again after changing the sources, stale proxies are ignored
+    python ingest.py [--force]
+"""
+
+import sys
+from gwmg import proxy
+
+# local package
+from settings import *
+import providers
+
+def ingest(force=False):
+    for provider in providers.sequences:
+        if not force and proxy.isCurrent(provider, PROXY_ROOT):
+            print "up to date: " + proxy.proxyPath(PROXY_ROOT, provider)
+            continue
+        provider.proxy = None
+        proxy.ingest(provider, PROXY_ROOT)
+
+if __name__ == '__main__':
+    ingest("--force" in sys.argv[1:])
@@ -44,6 +44,7 @@ Directory of files:
 
 # gwmg.bike.movie.py
 
+import sys
 from gwmg import base
 from gwmg import Effects
 
@@ -53,10 +54,16 @@ import providers
         
 class Maker(base.AnimationMaker):
     def buildAnimation(self, control):
+        # labels are for the profiler
+        control.label = "title"
         title(control)
+        control.label = "act1"
         act1(control)
+        control.label = "act2"
         act2(control)
+        control.label = "act3"
         act3(control)
+        control.label = "the_end"
         the_end(control)
 
 def title(control):
@@ -156,13 +163,13 @@ def act2(control):
     control.attach(\
         Effects.Mask(_range, _keeper, \
             (providers.fountain, _keeper, mask_keeper)))
-    # do some pixel swapping
+    # do some pixel swapping, both swappers in one pass where they overlap
     control.attach(\
-        Effects.ColorForColorPixelSwapper((_range[0],_range[0]+_delta/3), _keeper, \
-        (_keeper,), (255,0,0), (116, 125, 111), 30))
-    control.attach(\
-        Effects.ColorForColorPixelSwapper((_range[0]+_delta/4,_range[1]), _keeper, \
-        (_keeper,), (255,192,203), (192, 125, 68), 17))    
+        Effects.ColorSwapperGroup((\
+            Effects.ColorForColorPixelSwapper((_range[0],_range[0]+_delta/3), _keeper, \
+                (_keeper,), (255,0,0), (116, 125, 111), 30),
+            Effects.ColorForColorPixelSwapper((_range[0]+_delta/4,_range[1]), _keeper, \
+                (_keeper,), (255,192,203), (192, 125, 68), 17))))
     #throw in a girdled slice
     girdledSlice(control, (_range[0]+_delta*5/8,_range[1]-_delta/4), _keeper, \
         providers.behbike, (providers.pink, providers.white), \
@@ -243,4 +250,13 @@ def girdledSlice(control, grange, gkeeper, provider, color_providers, percents,
     
 if __name__ == '__main__':
     ohmygod = Maker((1,8100), OUTPUT_FILES, SIZE)
-    ohmygod.make()
+    if sys.argv[1:2] == ["preview"]:
+        args = sys.argv[2:] + [PREVIEW_SCALE, PREVIEW_STRIDE][len(sys.argv[2:]):]
+        ohmygod.preview(PREVIEW_FILES, float(args[0]), int(args[1]))
+    elif sys.argv[1:2] == ["farm"]:
+        # python movie.py farm [workers here], then movie.py work on the others
+        ohmygod.farm(FARM_ROOT, int((sys.argv[2:] + ["0"])[0]))
+    elif sys.argv[1:2] == ["work"]:
+        ohmygod.work(FARM_ROOT)
+    else:
+        ohmygod.make()
@@ -2,6 +2,7 @@
 
 from settings import *
 from gwmg import base
+from gwmg import proxy
 
 RESOURCES_ROOT = APPLICATION_ROOT + "bike_sources/"
 
@@ -31,3 +32,8 @@ behbike_mask    = base.MaskProvider(SIZE, RESOURCES_ROOT + "behbike_frames/behbi
 fountain_mask   = base.MaskProvider(SIZE, RESOURCES_ROOT + "fountain_frames/fountain%04d.png", True)
 auto_mask       = base.MaskProvider(SIZE, RESOURCES_ROOT + "automotion/automotionin %04d.jpg", True, "1")
 bike_mask_o     = base.MaskProvider(SIZE, RESOURCES_ROOT + "bike_frames/bike1_%04d.png", True, "L")
+
+# sequences ingest.py makes proxies of, they're used once they're made
+sequences       = (bike, behbike, tree, fountain, \
+                    tree_mask, behbike_mask, fountain_mask, auto_mask, bike_mask_o)
+proxy.useProxies(PROXY_ROOT, sequences)
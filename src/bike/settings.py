@@ -1,4 +1,15 @@
-SIZE = (720,480)
-APPLICATION_ROOT = "/home/brian/projects/gwmg_bike/"
-OUTPUT_FILES = "/home/brian/projects/gwmg_bike/frames/%04d.png"
-ACT_OVERLAP = 300
\ No newline at end of file
+import os
+
+# GWMG_ROOT and GWMG_SIZE (eg 360x240) point the movie somewhere else,
+# bench.py uses them to run it on synthetic sources
+SIZE = tuple([int(n) for n in os.environ.get("GWMG_SIZE", "720x480").split("x")])
+APPLICATION_ROOT = os.environ.get("GWMG_ROOT", "/home/brian/projects/gwmg_bike/")
+OUTPUT_FILES = APPLICATION_ROOT + "frames/%04d.png"
+# python movie.py preview [scale] [stride]
+PREVIEW_FILES = APPLICATION_ROOT + "preview/%04d.jpg"
+PREVIEW_SCALE = 0.25
+PREVIEW_STRIDE = 5
+# where the farm's queue and chunks go, every box has to see it
+FARM_ROOT = os.environ.get("GWMG_FARM", APPLICATION_ROOT + "farm/")
+ACT_OVERLAP = 300
+PROXY_ROOT = APPLICATION_ROOT + "proxies/"
@@ -0,0 +1,66 @@
+# gwmg.bike.test_backends.py
+
+"""
+The numpy backend, frame by frame and in blocks, against pil on a few
+frames out of each act of the movie, on bench.py's synthetic sources
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from gwmg import backends
+import bench
+
+# (first, last, what's going on), each act, the girdled slices' masks
+WINDOWS = ((40, 43, "title, a mask image"), \
+            (1334, 1337, "act1, the first girdled slice"), \
+            (3495, 3504, "act1 fading into act2"), \
+            (4800, 4803, "act2, a girdled slice over the fountain mask"), \
+            (7500, 7503, "act3"), \
+            (7860, 7863, "act3 collapsing"), \
+            (7900, 7903, "the end"))
+
+movie = None
+
+
+def setUpModule():
+    global movie, root
+    root = tempfile.mkdtemp()
+    bench.sources(root)
+    # settings read these when movie is imported
+    os.environ["GWMG_ROOT"] = root + "/"
+    os.environ["GWMG_SIZE"] = "180x120"
+    import movie
+
+
+def tearDownModule():
+    shutil.rmtree(root, True)
+
+
+class VerifyTest(unittest.TestCase):
+
+    def setUp(self):
+        if backends.numpy is None:
+            self.skipTest("no numpy")
+
+    def check(self, block_size):
+        for first, last, what in WINDOWS:
+            maker = movie.Maker((first, last), None, movie.SIZE, verbose=False, \
+                        backend="numpy", block_size=block_size)
+            try:
+                backends.verify(maker, first, last)
+            except ValueError, e:
+                self.fail("%s: %s" % (what, e))
+
+    def testFrames(self):
+        self.check(0)
+
+    def testBlocks(self):
+        self.check(8)
+
+
+if __name__ == '__main__':
+    unittest.main()
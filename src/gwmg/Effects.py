@@ -1,9 +1,30 @@
 # gwmg.Effects.py
 
 import base
+import backends
+import math
 import Image, ImageOps
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Effect(base.Observer):
+    """
+    Effects work out everything from the controller's frame number,
+    so any frame in range can be rendered without the ones before it
+    reads, writes, changesAt and readFrames tell the analysis passes
+    (eg rendercache) what an effect touches
+    blockable effects can work out a block of frames at once, see
+    Controller.blockSize, they implement blockImages
+    """
+    # attributes that are inputs or change from frame to frame,
+    # left out of describe
+    volatile = ("keeper", "providers", "currentFrame", "alpha", "tweenOutFrame", \
+                "block")
+    blockable = False
+
     def __init__(self, frame_range, keeper, providers):
         self.frameRange = frame_range
         self.keeper = keeper
@@ -12,7 +33,92 @@ class Effect(base.Observer):
         self.frameCount = frame_range[1] - frame_range[0]
     
     def update(self, controller):
-        self.currentFrame += 1
+        "currentFrame counts from 1 at the start of frameRange"
+        self.currentFrame = controller.frameNum - self.frameRange[0] + 1
+
+    def localFrame(self, frame_num):
+        "currentFrame at the controller's frame_num"
+        return frame_num - self.frameRange[0] + 1
+
+    def reads(self):
+        "the providers (keepers, controllers) update reads"
+        return [p for p in (self.providers or ()) if p is not None]
+
+    def writes(self, control):
+        "what update sets"
+        return [self.keeper]
+
+    def changesAt(self, frame_num):
+        "False when update leaves everything alone at frame_num"
+        return True
+
+    def readFrames(self, frame):
+        "the frame numbers update asks its providers for at currentFrame frame"
+        return [frame]
+
+    def canBlock(self):
+        "blockable, and nothing it reads is written frame by frame"
+        if not self.blockable:
+            return False
+        for provider in self.reads():
+            if isinstance(provider, (base.ImageKeeper, base.Controller, \
+                                        base.ControlFrameProvider)):
+                return False
+        return True
+
+    def hasBlock(self, frame_num):
+        block = getattr(self, "block", None)
+        return block is not None and block[0] <= frame_num < block[0] + len(block[1])
+
+    def fillBlock(self, control, frame_num, count):
+        "work out count frames from the controller's frame_num in one go"
+        frames = [self.localFrame(f) for f in range(frame_num, frame_num + count)]
+        images = self.blockImages(control, frames)
+        if len(images) == 1:
+            # the same every frame
+            images = [images[0]] * count
+        self.block = (frame_num, images)
+
+    def blockImages(self, control, frames):
+        """
+        what update would set at each currentFrame in frames, stacked
+        this runs update frame by frame, override it with the quick way
+        """
+        frame_num = control.frameNum
+        kept = self.keeper.peekImage()
+        block = getattr(self, "block", None)
+        self.block = None
+        images = []
+        try:
+            for frame in frames:
+                control.frameNum = frame + self.frameRange[0] - 1
+                self.update(control)
+                images.append(self.keeper.peekImage())
+        finally:
+            control.frameNum = frame_num
+            self.keeper.setImage(kept)
+            self.block = block
+        return images
+
+    def fromBlock(self, control):
+        "set the keeper from the block if it has this frame, True if it did"
+        if not self.hasBlock(control.frameNum):
+            return False
+        start, images = self.block
+        self.keeper.setImage(images[control.frameNum - start])
+        if control.frameNum == start + len(images) - 1:
+            self.block = None
+        return True
+
+    def describe(self):
+        "everything but the inputs and the frame that decides the output"
+        try:
+            return self.__description
+        except AttributeError:
+            settings = dict([(k, v) for k, v in vars(self).items() \
+                            if k not in self.volatile and not k.endswith("__description")])
+            self.__description = base.describe((self.__class__.__name__, settings))
+            return self.__description
         
     def inRange(self, frame_num):
         if frame_num >= self.frameRange[1]:
@@ -24,18 +130,25 @@ class Effect(base.Observer):
 
 class ColorScale(Effect):
     "make a colorized version of something"
+    blockable = True
     
     def __init__(self, frame_range, keeper, providers, background_color, foreground_color):
-        print frame_range
         Effect.__init__(self, frame_range, keeper, providers)
-        self.backImage = Image.new("RGB", providers[0].size, background_color)
-        self.foreImage = Image.new("RGB", providers[0].size, foreground_color)
+        self.backImage = backends.Solid("RGB", providers[0].size, background_color)
+        self.foreImage = backends.Solid("RGB", providers[0].size, foreground_color)
         
+    def blockImages(self, control, frames):
+        masks = control.backend.greyBlock(\
+                    [self.providers[0].getPixels(frame) for frame in frames])
+        return control.backend.compositeBlock([self.backImage], [self.foreImage], masks)
+
     def update(self, control):
         Effect.update(self, control)
-        image_in = self.providers[0].getImage(self.currentFrame)
-        image_mask = image_in.convert('L')
-        image_out = Image.composite(self.backImage, self.foreImage, image_mask)
+        if self.fromBlock(control):
+            return
+        image_in = self.providers[0].getPixels(self.currentFrame)
+        image_mask = control.backend.grey(image_in)
+        image_out = control.backend.composite(self.backImage, self.foreImage, image_mask)
         self.keeper.setImage(image_out)
 
   
@@ -51,15 +164,15 @@ class Mask(Effect):
         
     def update(self, control):
         Effect.update(self, control)
-        fore = self.foregroundProvider.getImage(self.currentFrame)
-        bg = self.backgroundProvider.getImage(self.currentFrame)
-        mask = self.maskProvider.getImage(self.currentFrame)
-        bg.paste(fore, (0,0,mask.size[0], mask.size[1]), mask)
-        self.keeper.setImage(bg)
+        fore = self.foregroundProvider.getPixels(self.currentFrame)
+        bg = self.backgroundProvider.getPixels(self.currentFrame)
+        mask = self.maskProvider.getPixels(self.currentFrame)
+        self.keeper.setImage(control.backend.composite(fore, bg, mask))
 
 class FadeInOutPercent(Effect):
     """fade in and then out via percentages (in,hold,out)
     used to be FaderPercentAnimation"""
+    blockable = True
     
     def __init__(self, frame_range, keeper, providers, percents, tween):
         Effect.__init__(self, frame_range, keeper, providers)
@@ -72,28 +185,80 @@ class FadeInOutPercent(Effect):
                         self.frameCount)
         self.tweenOutFrame = self.phases[0]
 
+    def alphaBefore(self, frame):
+        "alpha at a frame that is not fading out yet"
+        if frame < 1:
+            return 0
+        if frame <= self.phases[0]:
+            return self.tweenIn.getValue(frame)
+        return 1
+
+    def readFrames(self, frame):
+        if frame > self.phases[1]:
+            return [frame, self.phases[0] + frame - int(math.floor(self.phases[1]))]
+        return [frame]
+
+    def blendAt(self, frame):
+        "(providers[0]'s frame, alpha) at currentFrame frame, None while it holds"
+        if frame <= self.phases[0]:
+            return frame, self.alphaBefore(frame)
+        if frame <= self.phases[1]:
+            return None, 1
+        held = int(math.floor(self.phases[1]))
+        out_frames = frame - held
+        return self.phases[0] + out_frames, \
+                self.alphaBefore(held) - self.tweenOut.getValue(out_frames)
+
+    def blockImages(self, control, frames):
+        images1 = []
+        images2 = []
+        alphas = []
+        for frame in frames:
+            image2 = self.providers[1].getPixels(frame)
+            frame1, alpha = self.blendAt(frame)
+            if frame1 is None:
+                # holding, a blend of image2 with itself is image2
+                images1.append(image2)
+            else:
+                images1.append(self.providers[0].getPixels(frame1))
+            images2.append(image2)
+            alphas.append(alpha)
+        return control.backend.blendBlock(images1, images2, alphas)
+
     def update(self, control):
         Effect.update(self, control)
-        image2 = self.providers[1].getImage(self.currentFrame)
+        if self.fromBlock(control):
+            return
+        image2 = self.providers[1].getPixels(self.currentFrame)
         if self.currentFrame <= self.phases[0] :
             "fade in"
-            image1 = self.providers[0].getImage(self.currentFrame)
-            self.alpha += self.tweenIn.getStep(self.currentFrame)
-            img = Image.blend(image1, image2, self.alpha)
+            image1 = self.providers[0].getPixels(self.currentFrame)
+            self.alpha = self.alphaBefore(self.currentFrame)
+            img = control.backend.blend(image1, image2, self.alpha)
         if self.currentFrame > self.phases[0] and self.currentFrame <= self.phases[1]:
             "remain the same"
             self.alpha = 1
             img = image2
         if self.currentFrame > self.phases[1] :
             "fade out"
-            self.tweenOutFrame += 1
-            image1 = self.providers[0].getImage(self.tweenOutFrame)
-            self.alpha -= self.tweenOut.getStep(self.tweenOutFrame)
-            img = Image.blend(image1, image2, self.alpha)
+            self.tweenOutFrame, self.alpha = self.blendAt(self.currentFrame)
+            image1 = self.providers[0].getPixels(self.tweenOutFrame)
+            img = control.backend.blend(image1, image2, self.alpha)
         #print "alpha " + str(self.alpha)
         self.keeper.setImage(img) 
                 
 
+def sliceLayout(width, percents):
+    "(left, right) of each slice, percents of width side by side"
+    layout = []
+    x = 0
+    for percent in percents:
+        w = int(width * (float(percent) / float(100)))
+        layout.append((x, x + w))
+        x += w
+    return layout
+
+
 class SliceRepeaterPercentSlide(Effect):
     """"repeates a number of vertical slices"""
     
@@ -111,52 +276,103 @@ class SliceRepeaterPercentSlide(Effect):
             total_pixels += pix
             deltaP += percentages[i]
         self.__step_size = float(total_pixels) / slide_frame_count 
-        self.__x = 0
-        self.__end_x = providers[0].size[0]
-        self.__current_slice = self.sliceCount - 1
+        # slices slide in last to first, each for as many frames as
+        # it takes the step to cover its pixels
+        self.__slide_frames = []
+        for i in range(self.sliceCount - 1, -1, -1):
+            self.__slide_frames.append((i, self.__framesToCover(self.pixels[i])))
+        self.layout = sliceLayout(providers[0].size[0], percentages)
+
+    def __framesToCover(self, pixels):
+        "frames until x, stepping from 0, reaches pixels (at least one)"
+        if pixels <= 0:
+            return 1
+        if self.__step_size <= 0:
+            return None # never gets there
+        frames = max(1, int(math.ceil(pixels / self.__step_size)))
+        while frames * self.__step_size < pixels:
+            frames += 1
+        while frames > 1 and (frames - 1) * self.__step_size >= pixels:
+            frames -= 1
+        return frames
+
+    def slideAt(self, frame):
+        "(current slice, x) at a frame, current slice is -1 once all are in"
+        elapsed = frame - 1
+        for i, frames in self.__slide_frames:
+            if frames is None or elapsed < frames:
+                return i, elapsed * self.__step_size
+            elapsed -= frames
+        return -1, 0.00
     
     def update(self, control):
         Effect.update(self, control)
-        img = Image.new("RGB", self.providers[0].size)
+        current_slice, slide_x = self.slideAt(self.currentFrame)
+        img = base.buffers.blank("RGB", self.providers[0].size)
         src_img = self.providers[0].getImage(self.currentFrame)
-        size = self.providers[0].size
-        x = 0
-        for i in range(self.sliceCount):
-            w = int(size[0] * (float(self.percentages[i]) / float(100)))
-            l = x
-            x += w
-            r = x
-            if i > self.__current_slice:
-                tmpimg = ImageOps.fit(src_img, (w,img.size[1]))
+        end_x = self.providers[0].size[0]
+        for i, (l, r) in enumerate(self.layout):
+            if i > current_slice:
+                tmpimg = base.fit(src_img, (r - l, img.size[1]))
                 img.paste(tmpimg, (l,0,r,tmpimg.size[1]))
-            if i == self.__current_slice + 1:
-                self.__end_x = l 
-        if self.__current_slice >= 0:
-            start_x = int(self.__x)
+            if i == current_slice + 1:
+                end_x = l 
+        if current_slice >= 0:
+            start_x = int(slide_x)
             # paste left half
-            tmpimg = ImageOps.fit(src_img, (start_x, img.size[1]))
+            tmpimg = base.fit(src_img, (start_x, img.size[1]))
             img.paste(tmpimg, (0,0,start_x, tmpimg.size[1]))
             # paste right half
-            tmpimg = ImageOps.fit(src_img, ((self.__end_x - start_x), img.size[1]))
-            img.paste(tmpimg, (start_x, 0, self.__end_x, tmpimg.size[1]))
-            #self.__x += int(self.step_size[self.__current_slice])
-            self.__x += self.__step_size
-            if self.__x >= self.pixels[self.__current_slice]:
-                self.__x = 0.00
-                self.__current_slice -= 1
+            tmpimg = base.fit(src_img, ((end_x - start_x), img.size[1]))
+            img.paste(tmpimg, (start_x, 0, end_x, tmpimg.size[1]))
         self.keeper.setImage(img)
 
 class Commit(Effect):
     "commits keeper to control"
     def __init__(self, frame_range, keeper):
         Effect.__init__(self, frame_range, keeper, None)
+
+    def reads(self):
+        return [self.keeper]
+
+    def writes(self, control):
+        return [control]
         
     def update(self, control):
         Effect.update(self, control)
-        frame = self.keeper.getImage()
-        # make sure is RGB
-        if frame.mode != "RGB": frame = frame.convert("RGB")
-        control.frame = frame  
+        # make sure is RGB, and a PIL image
+        control.frame = control.backend.frame(self.keeper.getPixels())
+
+
+def swapColors(image, swaps):
+    """swap colors in one sweep over an RGB image, returns a new image
+    (an array for an array from the numpy backend)
+    swaps is a list of (source_color, target_color, threshold), applied in order,
+    a pixel within threshold of target_color on every band becomes source_color"""
+    if backends.isSolid(image):
+        return backends.solidOf(swapColors(image.pixel(), swaps), image.size)
+    if numpy is not None:
+        pixels = numpy.array(image, dtype=numpy.int16)
+        rgb = pixels[:, :, :3]
+        for source_color, target_color, threshold in swaps:
+            near = numpy.abs(rgb - numpy.array(target_color, dtype=numpy.int16)) < threshold
+            rgb[near.all(axis=2)] = source_color
+        if backends.isArray(image):
+            return pixels.astype(numpy.uint8)
+        return Image.fromarray(pixels.astype(numpy.uint8), image.mode)
+    # no numpy, do it by hand
+    target_pixels = list(image.getdata())
+    for xy in range(len(target_pixels)):
+        p = target_pixels[xy]
+        for source_color, target_color, threshold in swaps:
+            if abs(p[0] - target_color[0]) < threshold and \
+            abs(p[1] - target_color[1]) < threshold and \
+            abs(p[2] - target_color[2]) < threshold:
+                p = source_color
+        target_pixels[xy] = p
+    image = base.writable(image)
+    image.putdata(target_pixels)
+    return image
 
 
 class ColorForColorPixelSwapper(Effect):
@@ -172,71 +388,140 @@ class ColorForColorPixelSwapper(Effect):
         if tween:
             self.tween = tween(tween_change, frame_range[1] - frame_range[0])    
 
-    def update(self, control):
+    def currentSwap(self, control):
+        "step to this frame, returns (source, target, threshold)"
         Effect.update(self, control)
-        target_image = self.providers[0].getImage(self.currentFrame)
-        target_pixels = list(target_image.getdata())
-        # paste pixels back into picture
-        width = target_image.size[0]
-        height = target_image.size[1]
+        threshold = self.threshold
         if self.tween:
-            self.threshold += self.tween.getStep(self.currentFrame)
-        for y in range(height):
-            yp = y * width
-            for x in range(width):
-                xy = yp + x
-                p = target_pixels[xy]
-                if abs(p[0] - self.targetColor[0]) < self.threshold and \
-                abs(p[1] - self.targetColor[1]) < self.threshold and \
-                abs(p[2] - self.targetColor[2]) < self.threshold:
-                    target_pixels[xy] = self.sourceColor
-        target_image.putdata(target_pixels)
-        self.keeper.setImage(target_image)
+            threshold += self.tween.getValue(self.currentFrame)
+        return (self.sourceColor, self.targetColor, threshold)
+
+    def update(self, control):
+        swap = self.currentSwap(control)
+        target_image = self.providers[0].getPixels(self.currentFrame)
+        self.keeper.setImage(swapColors(target_image, [swap]))
+
+
+class ColorSwapperGroup(Effect):
+    """runs stacked ColorForColorPixelSwappers on the same keeper in one sweep
+    the swappers are handed to the group, don't attach them yourself"""
+
+    def __init__(self, swappers):
+        first = swappers[0]
+        for swapper in swappers:
+            if swapper.keeper is not first.keeper or \
+                    tuple(swapper.providers) != tuple(first.providers):
+                raise ValueError("grouped swappers must share keeper and providers")
+        frame_range = (min([s.frameRange[0] for s in swappers]), \
+                        max([s.frameRange[1] for s in swappers]))
+        Effect.__init__(self, frame_range, first.keeper, first.providers)
+        self.swappers = swappers
+
+    def changesAt(self, frame_num):
+        return bool([s for s in self.swappers if s.inRange(frame_num)])
+
+    def update(self, control):
+        Effect.update(self, control)
+        swaps = [s.currentSwap(control) for s in self.swappers \
+                    if s.inRange(control.frameNum)]
+        if not swaps:
+            return
+        target_image = self.providers[0].getPixels(self.currentFrame)
+        self.keeper.setImage(swapColors(target_image, swaps))
 
 class SimpleFader(Effect):
     "Fade one image provider into another"
+    blockable = True
     
     def __init__(self, frame_range, keeper, providers, tween):
         Effect.__init__(self, frame_range, keeper, providers)
         self.alpha = 0
         self.tween = tween(1, frame_range[1] - frame_range[0]) 
 
+    def blockImages(self, control, frames):
+        return control.backend.blendBlock(\
+                    [self.providers[0].getPixels(frame) for frame in frames], \
+                    [self.providers[1].getPixels(frame) for frame in frames], \
+                    self.tween.values(frames))
+
     def update(self, control):
         Effect.update(self, control)
-        image1 = self.providers[0].getImage(self.currentFrame)
-        image2 = self.providers[1].getImage(self.currentFrame)
-        self.alpha += self.tween.getStep(self.currentFrame)
-        img = Image.blend(image1, image2, self.alpha)
+        if self.fromBlock(control):
+            return
+        image1 = self.providers[0].getPixels(self.currentFrame)
+        image2 = self.providers[1].getPixels(self.currentFrame)
+        self.alpha = self.tween.getValue(self.currentFrame)
+        img = control.backend.blend(image1, image2, self.alpha)
         self.keeper.setImage(img) 
         
 
+def tileImage(tile, across, down):
+    """tile repeated across times and down times, as one image
+    numpy.tile does it in one go, without numpy the tiles are pasted
+    doubling up, so it's a few pastes, not across * down"""
+    w, h = tile.size
+    if numpy is not None and tile.mode in ("L", "RGB", "RGBA"):
+        array = numpy.asarray(tile)
+        return Image.fromarray(numpy.tile(array, \
+                    (down, across) + (1,) * (array.ndim - 2)), tile.mode)
+    row = Image.new(tile.mode, (w * across, h))
+    row.paste(tile, (0, 0))
+    done = 1
+    while done < across:
+        n = min(done, across - done)
+        row.paste(row.crop((0, 0, n * w, h)), (done * w, 0))
+        done += n
+    tiled = Image.new(tile.mode, (w * across, h * down))
+    tiled.paste(row, (0, 0))
+    done = 1
+    while done < down:
+        n = min(done, down - done)
+        tiled.paste(tiled.crop((0, 0, w * across, n * h)), (0, done * h))
+        done += n
+    return tiled
+
+
 class CollapsingSquares(Effect):
-    "squares = SquaresAnimation(squares_range, act2_keeper, act2_keeper, iterations)"
+    """squares = SquaresAnimation(squares_range, act2_keeper, act2_keeper, iterations)
+    the squares are cuts x cuts tiles of the source fitted down, from
+    the top left, what the division leaves over on the right and at the
+    bottom stays as it was"""
+    volatile = Effect.volatile + ("tiled",)
 
     def __init__(self, frame_range, keeper, providers, iterations):
         Effect.__init__(self, frame_range, keeper, providers)
-        self.__i = 0.00
         delta = frame_range[1] - frame_range[0]
         self.__step = float(iterations) / delta
+        self.tiled = None # (tile, cuts, tiled) last time
+
+    def cutsAt(self, frame):
+        "how many squares across at currentFrame frame"
+        return int(self.__step * frame) * 2
+
+    def reads(self):
+        return Effect.reads(self) + [self.keeper]
+
+    def changesAt(self, frame_num):
+        return self.cutsAt(self.localFrame(frame_num)) >= 1
+
+    def tiles(self, tile, cuts):
+        "tileImage, again only when the tile or cuts change"
+        if self.tiled is None or self.tiled[0] is not tile or self.tiled[1] != cuts:
+            self.tiled = (tile, cuts, tileImage(tile, cuts, cuts))
+        return self.tiled[2]
 
     def update(self, control):
         Effect.update(self, control)
-        self.__i += self.__step
-        cuts = int(self.__i) * 2
+        cuts = self.cutsAt(self.currentFrame)
         if cuts < 1:
             return
         w = self.providers[0].size[0] / cuts
         h = self.providers[0].size[1] / cuts            
         img = self.providers[0].getImage(self.currentFrame)
-        keeper_img = self.keeper.getImage()
-        img = ImageOps.fit(img, (w,h)) 
-        for x in range(cuts):
-            for y in range(cuts):
-                l = x * w
-                t = y * h
-                r = l + w
-                b = t + h
-                keeper_img.paste(img, (l,t,r,b))
+        keeper_img = base.writable(self.keeper.getImage())
+        # the fit's remembered, a source that stays put is fitted once
+        tiled = self.tiles(base.fit(img, (w,h)), cuts)
+        keeper_img.paste(tiled, (0, 0, tiled.size[0], tiled.size[1]))
         self.keeper.setImage(keeper_img)
 
 class SliceRepeaterPercent(Effect):
@@ -251,24 +536,22 @@ class SliceRepeaterPercent(Effect):
             self.maskProvider = providers[2]
         else:
             self.maskProvider = None
+        # the slices that get pasted, (left, right)
+        self.layout = [(l, r) for i, (l, r) in \
+                        enumerate(sliceLayout(providers[1].size[0], percents)) \
+                        if not(truths) or truths[i]]
     
     def update(self, control):
         Effect.update(self, control)
         src_img = self.providers[0].getImage(self.currentFrame)
-        img = self.providers[1].getImage(self.currentFrame)
-        size = self.providers[1].size
-        x = 0
-        for i in range(self.sliceCount):
-            w = int(size[0] * (float(self.percents[i]) / float(100)))
-            l = x
-            x += w
-            r = x
-            if not(self.truths) or (self.truths and self.truths[i]):
-                tmpimg = ImageOps.fit(src_img, (w,img.size[1]))
-                if self.maskProvider:
-                    mask = self.maskProvider.getImage(self.currentFrame)
-                    mask = ImageOps.fit(mask, tmpimg.size) 
-                    img.paste(tmpimg, (l,0,r,img.size[1]), mask)
-                else:
-                    img.paste(tmpimg, (l,0,r,img.size[1]))
+        img = base.writable(self.providers[1].getImage(self.currentFrame))
+        if self.maskProvider:
+            mask_img = self.maskProvider.getImage(self.currentFrame)
+        for l, r in self.layout:
+            tmpimg = base.fit(src_img, (r - l, img.size[1]))
+            if self.maskProvider:
+                mask = base.fit(mask_img, tmpimg.size)
+                img.paste(tmpimg, (l,0,r,img.size[1]), mask)
+            else:
+                img.paste(tmpimg, (l,0,r,img.size[1]))
         self.keeper.setImage(img)
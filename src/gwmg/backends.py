@@ -0,0 +1,359 @@
+# gwmg.backends.py
+
+"""
+How the compositing effects (Mask, SimpleFader, FadeInOutPercent,
+ColorScale, Commit) do their pixel work
+pil works on PIL images like it always has
+numpy keeps ndarrays (uint8, height x width for L, x 3 for RGB) in the
+keepers the whole way down the chain, PIL images from providers are
+turned into arrays once each, and the frame only goes back to a PIL
+image at Commit, on its way to the sink
+the other effects work in PIL, they take arrays through asImage
+numpy comes within a step or so of pil, see verify
+numpy also does blocks, many frames' worth of a blend at once on
+(frames, height, width[, 3]) arrays, see Controller.blockSize
+both fold Solids: a blend of two is worked out on one pixel and is a
+Solid too, a Solid pasted through a mask is a fill, the whole image is
+only made (once per colour) when something needs its pixels
+"""
+
+import Image
+import base
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Solid(object):
+    """
+    an image that's one colour all over, kept as (mode, size, color),
+    color as getpixel would give it
+    ColorProviders hand these out, see asImage for the pixels
+    """
+    nbytes = 0 # nothing's allocated until it's made
+
+    def __init__(self, mode, size, color):
+        self.mode = mode
+        self.size = tuple(size)
+        self.color = Image.new(mode, (1, 1), color).getpixel((0, 0))
+
+    def pixel(self):
+        "a 1x1 image of it, what the backends work Solids out on"
+        return Image.new(self.mode, (1, 1), self.color)
+
+    def colorIn(self, mode):
+        "the colour converted to mode, as paste would"
+        if mode == self.mode:
+            return self.color
+        return self.pixel().convert(mode).getpixel((0, 0))
+
+    def getbands(self):
+        return Image.getmodebands(self.mode) * ("?",)
+
+    def key(self):
+        return (self.mode, self.size, self.color)
+
+    def describe(self):
+        return "<solid %s %s %r>" % self.key()
+
+
+def isSolid(img):
+    return isinstance(img, Solid)
+
+
+def solidOf(pixel, size):
+    "a Solid of size the colour of a 1x1 image or array"
+    if isArray(pixel):
+        pixel = _toImage(pixel)
+    return Solid(pixel.mode, size, pixel.getpixel((0, 0)))
+
+
+def isArray(img):
+    return numpy is not None and isinstance(img, numpy.ndarray)
+
+
+def _bytes(img):
+    if isArray(img):
+        return img.nbytes
+    return base.imageBytes(img)
+
+
+# Solids' images, by value, see asImage
+_solids = None
+
+
+def _made(solid):
+    global _solids
+    if _solids is None:
+        _solids = base.ImageCache(base.SOLID_CACHE_BYTES)
+    def load():
+        return Image.new(solid.mode, solid.size, solid.color)
+    return _solids.get(solid.key(), load)
+
+
+def _entryBytes(entry):
+    return _bytes(entry[0]) + _bytes(entry[1])
+
+
+# conversions both ways, by id of what was converted, which the entry
+# holds on to, neither side is changed once it's handed out
+_converted = None
+
+
+def _convert(img, convert):
+    global _converted
+    if _converted is None:
+        _converted = base.ImageCache(base.CONVERTED_CACHE_BYTES, _entryBytes)
+        base.sourceCaches.append(_converted)
+    def load():
+        return (img, convert(img))
+    return _converted.get((id(img), convert.__name__), load)[1]
+
+
+def _toImage(array):
+    if array.ndim == 2:
+        return Image.fromarray(array, "L")
+    return Image.fromarray(array, "RGB")
+
+
+def _toArray(img):
+    if img.mode == "1":
+        array = numpy.asarray(img.convert("L"))
+    elif img.mode in ("L", "RGB"):
+        array = numpy.asarray(img)
+    else:
+        array = numpy.asarray(img.convert("RGB"))
+    array = numpy.ascontiguousarray(array, dtype=numpy.uint8)
+    array.flags.writeable = False
+    return array
+
+
+def asImage(img):
+    """
+    a PIL image of img, which may be an array from the numpy backend
+    or a Solid, don't change it
+    """
+    if isArray(img):
+        return _convert(img, _toImage)
+    if isSolid(img):
+        return _made(img)
+    return img
+
+
+def asArray(img):
+    "an array of a PIL image or Solid, don't change it"
+    if isArray(img):
+        return img
+    return _convert(asImage(img), _toArray)
+
+
+def _sameSize(images):
+    for img in images[1:]:
+        if img.size != images[0].size:
+            raise ValueError("images do not match")
+
+
+class PILBackend(object):
+    name = "pil"
+    blocks = False
+
+    def image(self, img):
+        return asImage(img)
+
+    def blend(self, image1, image2, alpha):
+        if isSolid(image1) and isSolid(image2):
+            _sameSize([image1, image2])
+            return solidOf(Image.blend(image1.pixel(), image2.pixel(), alpha), image1.size)
+        return Image.blend(asImage(image1), asImage(image2), alpha)
+
+    def grey(self, img):
+        if isSolid(img):
+            return solidOf(img.pixel().convert("L"), img.size)
+        return asImage(img).convert("L")
+
+    def composite(self, fore, back, mask):
+        "fore over back where mask is, in back's mode"
+        if isSolid(fore) and isSolid(back) and isSolid(mask) and mask.size == back.size:
+            pixel = back.pixel()
+            pixel.paste(fore.pixel(), (0, 0, 1, 1), mask.pixel())
+            return solidOf(pixel, back.size)
+        mask = asImage(mask)
+        back = base.writable(asImage(back))
+        if isSolid(fore):
+            # a fill, as good as pasting the whole image
+            back.paste(fore.colorIn(back.mode), (0,0,mask.size[0], mask.size[1]), mask)
+        else:
+            back.paste(asImage(fore), (0,0,mask.size[0], mask.size[1]), mask)
+        return back
+
+    def frame(self, img):
+        "img as an RGB PIL image for control.frame"
+        img = asImage(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return img
+
+
+class NumpyBackend(PILBackend):
+    """
+    same arithmetic as PIL's, in int32/float32 over whole arrays:
+    blend truncates like ImagingBlend, composite rounds like paste's
+    DIV255, grey is ITU-R 601-2 luma in 16 bit fixed point
+    """
+    name = "numpy"
+    blocks = True
+
+    def __init__(self):
+        if numpy is None:
+            raise ImportError("the numpy backend needs numpy")
+
+    def blend(self, image1, image2, alpha):
+        if isSolid(image1) and isSolid(image2):
+            _sameSize([image1, image2])
+            return solidOf(self.blend(_toArray(image1.pixel()), _toArray(image2.pixel()), \
+                                alpha), image1.size)
+        image1 = asArray(image1)
+        image2 = asArray(image2)
+        if image1.shape != image2.shape:
+            raise ValueError("images do not match")
+        return self.__blend(image1, image2, numpy.float32(alpha))
+
+    def __blend(self, image1, image2, alpha):
+        out = image1.astype(numpy.float32)
+        out = out + alpha * (image2.astype(numpy.float32) - out)
+        numpy.clip(out, 0, 255, out)
+        return out.astype(numpy.uint8)
+
+    def grey(self, img):
+        if isSolid(img):
+            return solidOf(self.grey(_toArray(img.pixel())), img.size)
+        img = asArray(img)
+        if img.ndim == 2:
+            return img
+        return self.__luma(img)
+
+    def __luma(self, rgb):
+        "L of the last axis"
+        rgb = rgb.astype(numpy.uint32)
+        grey = rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471
+        grey += 0x8000
+        grey >>= 16
+        return grey.astype(numpy.uint8)
+
+    def composite(self, fore, back, mask):
+        if isSolid(fore) and isSolid(back) and isSolid(mask) and mask.size == back.size:
+            return solidOf(self.composite(_toArray(fore.pixel()), _toArray(back.pixel()), \
+                                _toArray(mask.pixel())), back.size)
+        back = asArray(back)
+        if isSolid(fore):
+            # one pixel, broadcast over back
+            fore = _toArray(fore.pixel())
+        else:
+            fore = asArray(fore)
+        mask = asArray(self.grey(mask))
+        h, w = mask.shape[:2]
+        out = back.copy()
+        out[:h, :w] = self.__composite(fore[:h, :w], back[:h, :w], mask, back.ndim == 3)
+        return out
+
+    def __composite(self, fore, back, mask, rgb):
+        "paste's arithmetic, mask is L, fore goes to back's mode"
+        mask = mask.astype(numpy.int32)
+        if not rgb and fore.ndim > mask.ndim:
+            fore = self.__luma(fore)
+        elif rgb and fore.ndim == mask.ndim:
+            fore = fore[..., numpy.newaxis]
+        if rgb:
+            mask = mask[..., numpy.newaxis]
+        tmp = back * (255 - mask) + fore * mask + 128
+        return (((tmp >> 8) + tmp) >> 8).astype(numpy.uint8)
+
+    def stack(self, images):
+        """
+        images as one (frames, ...) array, images that are all the same
+        one stay (1, ...) and are broadcast, so a colour costs one frame
+        """
+        arrays = [asArray(img) for img in images]
+        if not [a for a in arrays if a is not arrays[0]]:
+            return arrays[0][numpy.newaxis]
+        shape = arrays[0].shape
+        if [a for a in arrays if a.shape != shape]:
+            raise ValueError("images do not match")
+        return numpy.array(arrays)
+
+    def blendBlock(self, images1, images2, alphas):
+        "blend for each frame, images1 and images2 per frame or one for all"
+        image1 = self.stack(images1)
+        image2 = self.stack(images2)
+        if image1.shape[1:] != image2.shape[1:]:
+            raise ValueError("images do not match")
+        alpha = numpy.array(alphas, dtype=numpy.float32).reshape(\
+                    (len(alphas),) + (1,) * (image1.ndim - 1))
+        return self.__blend(image1, image2, alpha)
+
+    def greyBlock(self, images):
+        "grey for each frame, (frames, height, width)"
+        stacked = self.stack(images)
+        if stacked.ndim == 3:
+            return stacked
+        return self.__luma(stacked)
+
+    def compositeBlock(self, fores, backs, masks):
+        "composite for each frame, the images must all be the same size"
+        back = self.stack(backs)
+        fore = self.stack(fores)
+        mask = self.greyBlock(masks)
+        if back.shape[1:3] != mask.shape[1:3] or fore.shape[1:3] != mask.shape[1:3]:
+            raise ValueError("images do not match")
+        return self.__composite(fore, back, mask, back.ndim == 4)
+
+    def frame(self, img):
+        if isArray(img):
+            if img.ndim == 2:
+                img = numpy.repeat(img[:, :, numpy.newaxis], 3, 2)
+            return Image.fromarray(numpy.ascontiguousarray(img), "RGB")
+        return PILBackend.frame(self, img)
+
+
+_backends = {}
+
+
+def get(name):
+    "the backend called name, pil or numpy"
+    if name not in _backends:
+        if name == "pil":
+            _backends[name] = PILBackend()
+        elif name == "numpy":
+            _backends[name] = NumpyBackend()
+        else:
+            raise ValueError("no backend called %r" % name)
+    return _backends[name]
+
+
+def verify(maker, first, last, tolerance=2):
+    """
+    render first to last with maker's backend and again with pil,
+    returns the biggest difference on any pixel band, raises
+    ValueError if it's over tolerance
+    """
+    if numpy is None:
+        raise ImportError("verify needs numpy")
+    renders = []
+    backend = maker.backend
+    try:
+        for name in (backend, "pil"):
+            maker.backend = name
+            renders.append([numpy.array(maker.frameImage(img), dtype=numpy.int16) \
+                            for frame_num, img in maker.frames(first, last)])
+    finally:
+        maker.backend = backend
+    worst = 0
+    for frame_num, (got, expected) in zip(range(first, last + 1), zip(*renders)):
+        diff = int(numpy.abs(got - expected).max())
+        if diff > tolerance:
+            raise ValueError("frame %d is off by %d with the %s backend" % \
+                    (frame_num, diff, backend))
+        worst = max(worst, diff)
+    return worst
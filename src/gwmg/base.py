@@ -1,6 +1,22 @@
 # gwmg.base.py
 
+import os
+import sys
+import time
+import bisect
+import md5
+import multiprocessing
+import threading
+import Queue
 import Image, ImageOps
+import output
+import checkpoint
+import rendercache
+import backends
+import profiler
+import proxy
+import curves
+import farm
 
     
 class Subject(object):
@@ -32,28 +48,289 @@ class Observer(object):
         pass
 
 
+class Timeline(object):
+    """
+    Observers' frameRanges compiled into spans of frames
+    where the same observers run
+    observers without a frameRange are asked inRange every frame
+    liveAt leaves out what wouldn't change the frame, see prune
+    """
+
+    def __init__(self, observers):
+        self.observers = list(observers)
+        bounds = set()
+        for observer in self.observers:
+            frame_range = getattr(observer, "frameRange", None)
+            if frame_range:
+                bounds.update(frame_range[:2])
+        self.__bounds = sorted(bounds)
+        # __spans[n] runs from __bounds[n - 1] up to __bounds[n],
+        # __spans[0] is before everything and the last one after
+        self.__spans = []
+        for n in range(len(self.__bounds) + 1):
+            self.__spans.append(self.__compile(n))
+        self.releases = self.__lastReads()
+        self.__live = {} # (span, which run) -> what's live, see liveAt
+
+    def __lastReads(self):
+        """
+        (end, provider) for everything the observers read that can be
+        released, by the end of the last range it's read in
+        nothing if there's an observer that can't say what it reads
+        """
+        ends = {}
+        for observer in self.observers:
+            if not hasattr(observer, "reads"):
+                return []
+            frame_range = getattr(observer, "frameRange", None)
+            for node in observer.reads():
+                if not hasattr(node, "release"):
+                    continue
+                end = ends.get(id(node), (node, 0))[1]
+                if not frame_range or end is None:
+                    end = None # read every frame
+                else:
+                    end = max(end, frame_range[1])
+                ends[id(node)] = (node, end)
+        releases = [(end, node) for node, end in ends.values() if end is not None]
+        releases.sort(key=lambda release: release[0])
+        return releases
+
+    def __compile(self, n):
+        "(observer, check inRange) pairs for span n, in attach order"
+        active = []
+        for observer in self.observers:
+            frame_range = getattr(observer, "frameRange", None)
+            if not frame_range:
+                active.append((observer, True))
+            elif n > 0 and n < len(self.__bounds) and \
+                    frame_range[0] <= self.__bounds[n - 1] and \
+                    self.__bounds[n] <= frame_range[1]:
+                active.append((observer, False))
+        return active
+
+    def __span(self, frame_num):
+        return bisect.bisect_right(self.__bounds, frame_num)
+
+    def entries(self, frame_num):
+        "(observer, check inRange) pairs at frame_num"
+        return self.__spans[self.__span(frame_num)]
+
+    def activeAt(self, frame_num):
+        "the observers that run at frame_num, in attach order"
+        return [observer for observer, check in self.entries(frame_num) \
+                    if not check or observer.inRange(frame_num)]
+
+    def liveAt(self, control, frame_num):
+        """
+        the observers that run at frame_num and change something
+        that's used, in attach order, see prune
+        """
+        n = self.__span(frame_num)
+        running = tuple([(not check or observer.inRange(frame_num)) and \
+                    (not hasattr(observer, "changesAt") or observer.changesAt(frame_num)) \
+                    for observer, check in self.__spans[n]])
+        live = self.__live.get((n, running))
+        if live is None:
+            live = self.__live[(n, running)] = prune(control, \
+                    [observer for (observer, check), runs in \
+                        zip(self.__spans[n], running) if runs])
+        return live
+
+    def pruned(self, control, first, last):
+        """
+        (observer, why, [(first, last), ...]) for the observers liveAt
+        leaves out between first and last, why is "idle" when changesAt
+        says it does nothing, "dead" when what it writes is written
+        again before it's read
+        """
+        runs = {}
+        for frame_num in range(first, last + 1):
+            live = self.liveAt(control, frame_num)
+            for observer, check in self.entries(frame_num):
+                if observer in live or (check and not observer.inRange(frame_num)):
+                    continue
+                why = "dead"
+                if hasattr(observer, "changesAt") and not observer.changesAt(frame_num):
+                    why = "idle"
+                spans = runs.setdefault((id(observer), why), (observer, why, []))[2]
+                if spans and spans[-1][1] == frame_num - 1:
+                    spans[-1] = (spans[-1][0], frame_num)
+                else:
+                    spans.append((frame_num, frame_num))
+        pruned = runs.values()
+        pruned.sort(key=lambda entry: (self.observers.index(entry[0]), entry[1]))
+        return pruned
+
+
+def imageNode(control, provider):
+    "the keeper or controller behind a provider, None for a plain one"
+    if provider is control or isinstance(provider, (Controller, ControlFrameProvider)):
+        return control
+    if isinstance(provider, ImageKeeper):
+        return provider
+    return None
+
+
+def carriesOver(control, observers):
+    """
+    one of observers reads a keeper or control.frame before one of them
+    sets it, so it gets what the frame before left there
+    an observer that can't say what it reads reads everything
+    """
+    written = set()
+    for observer in observers:
+        if not hasattr(observer, "reads"):
+            return True
+        for provider in observer.reads():
+            node = imageNode(control, provider)
+            if node is not None and id(node) not in written:
+                return True
+        if hasattr(observer, "writes"):
+            for node in observer.writes(control):
+                written.add(id(imageNode(control, node)))
+    return False
+
+
+def prune(control, observers):
+    """
+    observers less the ones that are dead: all they write (keepers or
+    control.frame) is set again by a later one before anything reads it
+    setImage swaps the whole image, so a write is all or nothing
+    what's left at the end of the frame is live, the next frame may
+    read it, an observer that can't say what it reads reads everything
+    """
+    live = []
+    overwritten = set()
+    for observer in reversed(observers):
+        if not hasattr(observer, "writes") or not hasattr(observer, "reads"):
+            overwritten = set()
+            live.append(observer)
+            continue
+        writes = [id(imageNode(control, node) or node) for node in observer.writes(control)]
+        if writes and not [node for node in writes if node not in overwritten]:
+            continue
+        overwritten.update(writes)
+        for node in observer.reads():
+            overwritten.discard(id(imageNode(control, node)))
+        live.append(observer)
+    live.reverse()
+    return live
+
+
 class Controller(Subject):
     """
     Base Controller
     Attach animations to a controller
+    the observers' frameRanges are compiled into a Timeline on the first
+    notify, so each frame only visits what runs
+    backend does the effects' compositing, see backends.py
+    blockSize > 1 asks effects that can for that many frames at a time,
+    as one stacked array, they hand them out frame by frame after that
+    (a backend that does blocks only, ie numpy)
+    label names what's being attached, eg the act, for the profiler
+    providers are released once the last range that reads them is
+    over, they load again if they're asked for after, releasing=False
+    keeps them
+    observers that do nothing, or nothing that's used, at a frame are
+    skipped (see Timeline.liveAt), pruning=False runs them anyway
     """    
 
-    def __init__(self, frame_range):
+    def __init__(self, frame_range, backend="pil", block_size=0):
         Subject.__init__(self)
         self.frameNum = frame_range[0] - 1
         self.frameRange = frame_range
         self.frame = None
+        self.backend = backends.get(backend)
+        self.blockSize = block_size
+        self.label = None
+        self.acts = {} # id(observer) -> (label, attach order)
+        self.releasing = True
+        self.pruning = True
+        self.__timeline = None
+        self.__released = 0 # how far into the timeline's releases
+
+    def attach(self, observer):
+        Subject.attach(self, observer)
+        if id(observer) not in self.acts:
+            self.acts[id(observer)] = (self.label or "-", len(self._observers) - 1)
+        self.__timeline = None
+        self.__released = 0
+
+    def detach(self, observer):
+        Subject.detach(self, observer)
+        self.__timeline = None
+        self.__released = 0
+
+    def timeline(self):
+        if self.__timeline is None:
+            self.__timeline = Timeline(self._observers)
+        return self.__timeline
+
+    def activeAt(self, frame_num):
+        "the observers that run at frame_num, in attach order"
+        return self.timeline().activeAt(frame_num)
 
     def notify(self, modifier=None):
         self.frameNum += 1
-        for observer in self._observers:
-            if modifier != observer and \
-                    observer.inRange(self.frameNum):
+        active = profiler.current
+        if active is not None:
+            active.enter("render")
+        if self.pruning:
+            running = self.timeline().liveAt(self, self.frameNum)
+        else:
+            running = self.activeAt(self.frameNum)
+        for observer in running:
+            if modifier != observer:
+                if active is not None:
+                    active.update(self, observer)
+                    continue
+                if self.blockSize > 1 and self.backend.blocks:
+                    self.fillBlock(observer)
                 observer.update(self)
+        if active is not None:
+            active.leave()
+        if self.releasing:
+            self.releaseFinished()
+        copies.endFrame()
+        buffers.endFrame()
+
+    def releaseFinished(self):
+        "release the providers nothing reads after this frame"
+        releases = self.timeline().releases
+        while self.__released < len(releases) and \
+                releases[self.__released][0] <= self.frameNum + 1:
+            releases[self.__released][1].release()
+            self.__released += 1
+
+    def fillBlock(self, observer):
+        "have observer work out a block from this frame if it can and hasn't"
+        if not getattr(observer, "canBlock", None) or not observer.canBlock() or \
+                observer.hasBlock(self.frameNum):
+            return
+        count = min(self.blockSize, observer.frameRange[1] - self.frameNum, \
+                    self.frameRange[1] - self.frameNum)
+        if count > 1:
+            observer.fillBlock(self, self.frameNum, count)
+
+    def pruned(self, first, last):
+        "what's skipped between first and last, see Timeline.pruned"
+        return self.timeline().pruned(self, first, last)
+
+    def seek(self, frame_num):
+        "the next notify renders frame_num"
+        self.frameNum = frame_num - 1
+
+    def isIdle(self, frame_num):
+        "nothing attached runs at frame_num"
+        return not self.activeAt(frame_num)
     
     def getImage(self, frame_num=None):
         "can be used as a FrameProvider"
-        return self.frame.copy()
+        return self.frame
+
+    def getPixels(self, frame_num=None):
+        return self.frame
         
 
 class Animation(Observer):
@@ -67,7 +344,7 @@ class Animation(Observer):
         self.currentFrame = 0
     
     def update(self, controller):
-        self.currentFrame += 1
+        self.currentFrame = controller.frameNum - self.__frameRange[0] + 1
      
     def inRange(self, frame_num):
         if frame_num >= self.__frameRange[1]:
@@ -78,44 +355,807 @@ class Animation(Observer):
             return True
 
 
+def describe(value):
+    """
+    a string that changes whenever value would render differently
+    images by content, providers by class (they're inputs, fingerprinted
+    by frame), effects and tweens by their settings
+    """
+    if value is None or isinstance(value, (bool, int, long, float, str, unicode)):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        return "(%s)" % ",".join([describe(v) for v in value])
+    if isinstance(value, dict):
+        return "{%s}" % ",".join(["%s:%s" % (describe(k), describe(v)) \
+                                    for k, v in sorted(value.items())])
+    if hasattr(value, "describe"):
+        return value.describe()
+    if hasattr(value, "getImage"):
+        return "<%s>" % value.__class__.__name__
+    if hasattr(value, "tostring") and hasattr(value, "mode"):
+        return "<image %s %s %s>" % (value.mode, value.size, \
+                                        md5.new(value.tostring()).hexdigest())
+    if hasattr(value, "__dict__"):
+        return "<%s %s>" % (value.__class__.__name__, describe(vars(value)))
+    return "<%s>" % value.__class__.__name__
+
+
+_digests = {}
+
+def fileDigest(path):
+    "md5 of a file's bytes, read once per (path, mtime, size)"
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _digests:
+        _digests[key] = md5.new(open(path, "rb").read()).hexdigest()
+    return _digests[key]
+
+
+class CopyCounter(object):
+    "counts the bytes writable copies, per frame"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.copies = 0
+        self.bytes = 0
+        self.frames = 0
+        self.frameBytes = 0
+        self.peakFrameBytes = 0
+
+    def count(self, image):
+        nbytes = imageBytes(image)
+        self.copies += 1
+        self.bytes += nbytes
+        self.frameBytes += nbytes
+
+    def endFrame(self):
+        self.frames += 1
+        self.peakFrameBytes = max(self.peakFrameBytes, self.frameBytes)
+        self.frameBytes = 0
+
+    def summary(self):
+        return "copied %.1fMB in %d copies, %.1fKB a frame, at most %.1fKB" % \
+                (self.bytes / 1048576.0, self.copies, \
+                self.bytes / 1024.0 / max(1, self.frames), self.peakFrameBytes / 1024.0)
+
+
+copies = CopyCounter()
+
+
+# what the caches and the buffer pool hold at most, per process (jobs=N
+# is N times this), 320MB all told:
+#   frameCache     decoded source frames and the masks made of them
+#   fitCache       fits of provider images
+#   derivedCache   masks made of keepers' images
+#   backends       Solids' images, and PIL images <-> numpy arrays
+#   buffers        images waiting in the pool
+# entries made from an image no one has any more are swept out at the
+# end of every frame, see sweep
+MB = 1024 * 1024
+FRAME_CACHE_BYTES = 192 * MB
+FIT_CACHE_BYTES = 32 * MB
+DERIVED_CACHE_BYTES = 16 * MB
+SOLID_CACHE_BYTES = 16 * MB
+CONVERTED_CACHE_BYTES = 32 * MB
+BUFFER_POOL_BYTES = 32 * MB
+
+
+class BufferPool(object):
+    """
+    images effects paste into, by (mode, size), used again rather than
+    allocated every frame
+    what's handed out is kept track of, at the end of each frame the
+    ones nothing else refers to any more (not a keeper, control.frame,
+    a cache or a writer's queue) come back to the pool, the caches'
+    entries for images that are gone are swept out first, see sweep
+    max_bytes caps what waits in the pool, past it they're let go
+    the render thread's, not the prefetcher's or the writers'
+    """
+    modes = ("1", "L", "RGB", "RGBA")
+
+    def __init__(self, max_bytes=BUFFER_POOL_BYTES):
+        self.maxBytes = max_bytes
+        self.__free = {} # (mode, size) -> images
+        self.__freeBytes = 0
+        self.__out = []
+        self.__outBytes = 0
+        self.reset()
+
+    def reset(self):
+        "start the counts again, the images stay"
+        self.acquired = 0
+        self.reused = 0
+        self.returned = 0
+        self.peakBytes = self.__outBytes + self.__freeBytes
+
+    def acquire(self, mode, size):
+        "an image of mode and size to paste all over, its pixels are old"
+        size = tuple(size)
+        self.acquired += 1
+        free = self.__free.get((mode, size))
+        if free:
+            img = free.pop()
+            self.reused += 1
+            self.__freeBytes -= imageBytes(img)
+        else:
+            img = Image.new(mode, size)
+        self.__track(img)
+        return img
+
+    def copy(self, image):
+        "image.copy(), into a pooled image"
+        if image.mode not in self.modes:
+            return image.copy()
+        img = self.acquire(image.mode, image.size)
+        img.paste(image, (0, 0) + image.size)
+        img.info = image.info.copy()
+        return img
+
+    def blank(self, mode, size, color=0):
+        "Image.new(mode, size, color), from the pool"
+        img = self.acquire(mode, size)
+        img.paste(color, (0, 0) + tuple(size))
+        return img
+
+    def __track(self, img):
+        self.__out.append(img)
+        self.__outBytes += imageBytes(img)
+        self.peakBytes = max(self.peakBytes, self.__outBytes + self.__freeBytes)
+
+    def endFrame(self):
+        "take back what only we refer to now"
+        sweep(self.__out)
+        still = []
+        for img in self.__out:
+            # the list, img and getrefcount's argument
+            if sys.getrefcount(img) <= 3:
+                self.__outBytes -= imageBytes(img)
+                self.__put(img)
+            else:
+                still.append(img)
+        self.__out = still
+
+    def __put(self, img):
+        nbytes = imageBytes(img)
+        if self.__freeBytes + nbytes > self.maxBytes:
+            return
+        self.__free.setdefault((img.mode, img.size), []).append(img)
+        self.__freeBytes += nbytes
+        self.returned += 1
+
+    def outstanding(self):
+        "how many handed out images haven't come back"
+        return len(self.__out)
+
+    def clear(self):
+        "let go of the waiting images"
+        self.__free = {}
+        self.__freeBytes = 0
+
+    def summary(self):
+        return "buffers: %d of %d reused (%.0f%%), %d waiting (%.1fMB), %d out, at most %.1fMB" % \
+                (self.reused, self.acquired, 100.0 * self.reused / max(1, self.acquired), \
+                sum([len(free) for free in self.__free.values()]), \
+                self.__freeBytes / 1048576.0, len(self.__out), self.peakBytes / 1048576.0)
+
+
+buffers = BufferPool()
+
+
+def writable(image):
+    """
+    a copy of image that's safe to paste into
+    getImage hands out images shared with the provider (and whoever
+    else asked), so effects that change what they get go through here
+    the copy comes from the buffer pool
+    """
+    copies.count(image)
+    return buffers.copy(image)
+
+
 class ImageProvider(object):
     """
     ImageProvider is wicket
+    getImage hands out a shared image, don't change it, see writable
+    getPixels is what effects that go through control.backend read, the
+    same image, or what the backends are quicker with (a backends.Solid,
+    a numpy array), getImage is always a PIL image
+    fingerprint(frameNum) names what getImage(frameNum) gives, cheaply
+    size is scaled down while previewing, see scaledSize
+    nothing is loaded until it's asked for, release drops it again
     """
 
     def __init__(self, size, default=None):
         self.size = size
-        if default:
-            self.__default = Image.open(default)
-            if self.__default.mode != "RGB":
-                self.__default = self.__default.convert("RGB")
-            if self.__default.size != size:
-                self.__default = ImageOps.fit(self.__default,self.size)
-                
+        self.__src = default
+        self.__defaults = {} # size -> the default image at that size
+
+    def getSize(self):
+        return scaledSize(self.__size)
+
+    def setSize(self, size):
+        self.__size = size
+
+    size = property(getSize, setSize)
+
     def getImage(self, frameNum):
-        if not(self.__default):
-            return Image.new("RGB", self.size, "White")
+        size = self.size
+        img = self.__defaults.get(size)
+        if img is None:
+            img = self.__defaults[size] = self.loadDefault(size)
+        return img
+
+    def getPixels(self, frameNum):
+        return self.getImage(frameNum)
+
+    def loadDefault(self, size):
+        if not self.__src:
+            return Image.new("RGB", size, "White")
+        img = openImage(self.__src, size)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != size:
+            img = ImageOps.fit(img, size)
+        return img
+
+    def release(self):
+        "let go of what's loaded, it's loaded again if it's asked for"
+        self.__defaults = {}
+
+    def fingerprint(self, frameNum):
+        if not self.__src:
+            return "%s %s white" % (self.__class__.__name__, self.size)
+        return "%s %s %s" % (self.__class__.__name__, self.size, fileDigest(self.__src))
+
+    def profileName(self):
+        "what the profiler calls reads from this"
+        if not self.__src:
+            return self.__class__.__name__
+        return "%s %s" % (self.__class__.__name__, os.path.basename(self.__src))
+
+
+# what providers scale their size by, 1.0 but for previews, see
+# AnimationMaker.preview
+previewScale = 1.0
+
+
+def setPreviewScale(scale):
+    "returns the scale it was"
+    global previewScale
+    old, previewScale = previewScale, scale
+    return old
+
+
+def scaledSize(size):
+    if previewScale == 1.0:
+        return size
+    return (max(1, int(size[0] * previewScale)), max(1, int(size[1] * previewScale)))
+
+
+def openImage(path, size):
+    """
+    Image.open, when previewing JPEGs are decoded in draft mode, at the
+    smallest of 1/2, 1/4 or 1/8 of their size that's still over size
+    """
+    img = Image.open(path)
+    if previewScale < 1.0 and img.format == "JPEG":
+        img.draft(img.mode, tuple(size))
+    return img
+
+
+def residentMB():
+    "this process's resident memory, its peak where there's no /proc"
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Startup(object):
+    "how long a process took to get its first frame out, and its size then"
+
+    def __init__(self):
+        self.restart()
+
+    def restart(self):
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.firstFrame = None
+        self.firstMB = None
+
+    def check(self):
+        "start over in a forked process, it starts now"
+        if self.pid != os.getpid():
+            self.restart()
+
+    def frameOut(self):
+        if self.firstFrame is None:
+            self.firstFrame = time.time() - self.started
+            self.firstMB = residentMB()
+
+    def summary(self):
+        if self.firstFrame is None:
+            return "no frames, %.1fMB resident" % residentMB()
+        return "first frame %.2fs after starting at %.1fMB resident, %.1fMB now" % \
+                (self.firstFrame, self.firstMB, residentMB())
+
+
+# from when base is imported, which is about when the movie starts
+startup = Startup()
+
+
+def imageBytes(image):
+    "roughly how much memory an image's pixels take"
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class ImageCache(object):
+    """
+    LRU cache of decoded images, bounded by bytes
+    counts hits, misses and evictions
+    safe to share between threads, a key being loaded by one thread
+    is waited for by the others rather than loaded twice
+    """
+
+    def __init__(self, max_bytes=FRAME_CACHE_BYTES, size_of=None):
+        self.maxBytes = max_bytes
+        self.sizeOf = size_of or imageBytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.waits = 0
+        self.__entries = {}
+        self.__order = [] # least recently used first
+        self.__loading = {} # key -> Event set once it's loaded
+        self.__pid = None
+        self.__lock = None
+
+    def __guard(self):
+        "the lock, a fresh one in a forked process, the old one may be held"
+        if self.__pid != os.getpid():
+            self.__pid = os.getpid()
+            self.__lock = threading.Lock()
+            self.__loading = {}
+        return self.__lock
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def loading(self, key):
+        return key in self.__loading
+
+    def get(self, key, load):
+        "cached image for key, load() it on a miss"
+        lock = self.__guard()
+        lock.acquire()
+        try:
+            if key in self.__entries:
+                self.hits += 1
+                self.__order.remove(key)
+                self.__order.append(key)
+                return self.__entries[key][0]
+            loaded = self.__loading.get(key)
+            if loaded is None:
+                self.misses += 1
+                loaded = self.__loading[key] = threading.Event()
+                mine = True
+            else:
+                self.waits += 1
+                mine = False
+        finally:
+            lock.release()
+        if not mine:
+            loaded.wait()
+            return self.get(key, load)
+        image = None
+        try:
+            image = load()
+        finally:
+            lock.acquire()
+            try:
+                if image is not None:
+                    self.__put(key, image)
+                del self.__loading[key]
+                loaded.set()
+            finally:
+                lock.release()
+        return image
+
+    def put(self, key, image):
+        lock = self.__guard()
+        lock.acquire()
+        try:
+            self.__put(key, image)
+        finally:
+            lock.release()
+
+    def __put(self, key, image):
+        self.__discard(key)
+        nbytes = self.sizeOf(image)
+        if nbytes > self.maxBytes:
+            return
+        while self.__order and self.bytes + nbytes > self.maxBytes:
+            self.__discard(self.__order[0])
+            self.evictions += 1
+        self.__entries[key] = (image, nbytes)
+        self.__order.append(key)
+        self.bytes += nbytes
+
+    def discard(self, key):
+        lock = self.__guard()
+        lock.acquire()
+        try:
+            self.__discard(key)
+        finally:
+            lock.release()
+
+    def __discard(self, key):
+        if key in self.__entries:
+            self.bytes -= self.__entries.pop(key)[1]
+            self.__order.remove(key)
+
+    def clear(self):
+        for key in list(self.__order):
+            self.discard(key)
+
+    def sources(self):
+        "(key, source) of each entry, for caches of (source, made) pairs"
+        lock = self.__guard()
+        lock.acquire()
+        try:
+            return [(key, entry[0][0]) for key, entry in self.__entries.items()]
+        finally:
+            lock.release()
+
+    def stats(self):
+        return {"entries": len(self.__order), "bytes": self.bytes, \
+                "hits": self.hits, "misses": self.misses, \
+                "evictions": self.evictions, "waits": self.waits}
+
+
+# decoded and fitted source frames, shared by every provider in the process
+frameCache = ImageCache()
+
+
+def fittedKey(path, size):
+    return (os.path.realpath(path), size)
+
+
+def loadFitted(path, size):
+    "open path and fit it to size, once per process"
+    def load():
+        return ImageOps.fit(openImage(path, size), size)
+    return frameCache.get(fittedKey(path, size), load)
+
+
+def _fittedBytes(entry):
+    source, fitted = entry
+    return imageBytes(source) + imageBytes(fitted)
+
+
+# fit results by (id of the source image, size, method), see fit
+fitCache = ImageCache(FIT_CACHE_BYTES, _fittedBytes)
+
+
+def fit(image, size, method=None):
+    """
+    ImageOps.fit, remembered, so a provider's image fitted to the same
+    size frame after frame is only fitted once
+    images from getImage aren't changed once handed out (see writable),
+    so the source itself is the version, the entry holds on to it so
+    its id can't come round again
+    """
+    size = tuple(size)
+    if image.size == size:
+        return image
+    def load():
+        if method is None:
+            return (image, ImageOps.fit(image, size))
+        return (image, ImageOps.fit(image, size, method))
+    return fitCache.get((id(image), size, method), load)[1]
+
+
+def maskChain(invert, type):
+    "the transforms that make a mask of an image"
+    return (invert and (("invert",),) or ()) + (("convert", type),)
+
+
+def transform(image, chain):
+    "image through chain, steps are (\"invert\",), (\"convert\", mode), (\"fit\", size)"
+    for step in chain:
+        if step[0] == "invert":
+            image = ImageOps.invert(image)
+        elif step[0] == "convert":
+            image = image.convert(step[1])
+        elif step[0] == "fit":
+            image = ImageOps.fit(image, step[1])
         else:
-            return self.__default.copy()
+            raise ValueError("no transform %r" % (step,))
+    return image
+
+
+def loadDerived(path, size, chain):
+    """
+    the fitted frame at path through chain, once per process, in
+    frameCache next to the frame itself so providers of the same file
+    share it
+    """
+    def load():
+        return transform(loadFitted(path, size), chain)
+    return frameCache.get(fittedKey(path, size) + (chain,), load)
+
+
+def _derivedBytes(entry):
+    # the base can be an array, sized the way the backends size theirs
+    return backends._entryBytes(entry)
+
+
+# derived images by (id of the base image, chain), see derived
+derivedCache = ImageCache(DERIVED_CACHE_BYTES, _derivedBytes)
+
+# caches keyed by the id of a source image they hold on to, see sweep
+sourceCaches = [fitCache, derivedCache]
+
+
+def _entriesBySource():
+    "{id: (source, [(cache, key), ...])} over the sourceCaches"
+    entries = {}
+    for cache in sourceCaches:
+        for key, source in cache.sources():
+            entries.setdefault(id(source), (source, []))[1].append((cache, key))
+    return entries
+
+
+def sweep(held=()):
+    """
+    drop the sourceCaches' entries for images nothing else refers to,
+    no one has the image to ask for them with any more, and they keep
+    pooled buffers from coming back
+    held - images the caller refers to once each and doesn't count,
+    the pool's handed out buffers
+    """
+    held = set(map(id, held))
+    for source, keys in _entriesBySource().values():
+        # the dict's tuple, source, getrefcount's argument and an entry each
+        known = 3 + len(keys) + (id(source) in held and 1 or 0)
+        if sys.getrefcount(source) <= known:
+            for cache, key in keys:
+                cache.discard(key)
+
+
+def derived(image, chain):
+    """
+    transform(image, chain), remembered like fit is, for images that
+    are read again as they are, a keeper's unchanged image, say
+    image can be an array from the numpy backend
+    """
+    def load():
+        return (image, transform(backends.asImage(image), chain))
+    return derivedCache.get((id(image), chain), load)[1]
+
+
+class Prefetcher(object):
+    """
+    A few threads that load frames into frameCache ahead of the render,
+    so decoding overlaps the effects instead of holding them up
+    FrameProviders ask for the next `ahead` frames each time they're read
+    ahead=0 turns it off
+    stop() ends the threads, make does it when it's done, the next
+    want() starts them again
+    """
+
+    def __init__(self, workers=2, ahead=4):
+        self.workers = workers
+        self.ahead = ahead
+        self.prefetched = 0
+        self.__pid = None
+
+    def __start(self):
+        "threads don't survive a fork, start them in each process"
+        self.__pid = os.getpid()
+        self.__queue = Queue.Queue()
+        self.__queued = set()
+        self.__lock = threading.Lock()
+        self.__threads = []
+        for n in range(self.workers):
+            thread = threading.Thread(target=self.__work)
+            thread.setDaemon(True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def __work(self):
+        while True:
+            wanted = self.__queue.get()
+            if wanted is None:
+                return
+            path, size = wanted
+            try:
+                loadFitted(path, size)
+                self.prefetched += 1
+            except Exception:
+                # leave it, the render will hit the error itself
+                pass
+            self.__lock.acquire()
+            self.__queued.discard((path, size))
+            self.__lock.release()
+
+    def want(self, paths, size):
+        "load paths in the background unless they're cached or on the way"
+        if not self.ahead or not self.workers:
+            return
+        if self.__pid != os.getpid():
+            self.__start()
+        self.__lock.acquire()
+        try:
+            for path in paths:
+                key = fittedKey(path, size)
+                if key in frameCache or frameCache.loading(key) or \
+                        (path, size) in self.__queued:
+                    continue
+                self.__queued.add((path, size))
+                self.__queue.put((path, size))
+        finally:
+            self.__lock.release()
+
+    def stop(self):
+        """
+        drop what's still queued and wait for the threads to finish the
+        frames they're on, so none are left decoding while the
+        interpreter shuts down
+        """
+        if self.__pid != os.getpid():
+            return
+        self.__lock.acquire()
+        try:
+            while True:
+                try:
+                    self.__queued.discard(self.__queue.get_nowait())
+                except Queue.Empty:
+                    break
+        finally:
+            self.__lock.release()
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__pid = None
+
+    def summary(self):
+        return "prefetched %d frames, waited on %d" % \
+                (self.prefetched, frameCache.waits)
+
+
+prefetcher = Prefetcher()
 
 
 class FrameProvider(ImageProvider):
-    "provide a frame based on src string"
+    """
+    provide a frame based on src string, src % 1, src % 2, ...
+    the sequence is indexed when it's made, past the end it starts
+    providing frames from the begining
+    with a proxy (see proxy.py) frames come out of that, not the files,
+    unless it's a preview and the proxy is the wrong size
+    the index and the proxy are only looked at on the first read
+    """
 
     def __init__(self, size, src):
         ImageProvider.__init__(self, size)
         self.__src = src
-        self.__offset = 0 #how much to subtract from frame_num
+        self.__index = None
+        self.__proxyDirectory = None
+        self.proxy = None
 
-    def getImage(self, frame_num):
-        """ try helps us loop to begining of sequence
-        if we reach the end start providing frames from the begining"""
+    def useProxy(self, directory):
+        "read from our proxy in directory, if there's a good one there"
+        self.__proxyDirectory = directory
+        self.proxy = None
+
+    def frames(self):
+        if self.__index is None:
+            self.__index = self.indexFrames()
+        return self.__index
+
+    def indexFrames(self):
+        "the paths of frames 1 up to the first missing one, one listdir"
+        directory = os.path.dirname(self.__src) or "."
         try:
-            image = Image.open(self.__src % (frame_num - self.__offset))
-        except IOError:
-            self.__offset = frame_num - 1
-            image = Image.open(self.__src % (frame_num - self.__offset))
-        return ImageOps.fit(image, self.size)
+            names = set(os.listdir(directory))
+        except OSError:
+            return []
+        frames = []
+        while os.path.basename(self.__src % (len(frames) + 1)) in names:
+            frames.append(self.__src % (len(frames) + 1))
+        return frames
+
+    def sequenceLength(self):
+        return len(self.frames())
+
+    def framePaths(self):
+        return list(self.frames())
+
+    def frameIndex(self, frame_num):
+        "where frame_num is in the index, looping"
+        return (int(frame_num) - 1) % len(self.frames())
+
+    def framePath(self, frame_num):
+        "the file for frame_num, looping over the index"
+        frame_num = int(frame_num)
+        if not self.frames():
+            return self.__src % frame_num
+        return self.__index[self.frameIndex(frame_num)]
+
+    def proxyKey(self):
+        "what a proxy of this sequence is made from"
+        return "%s %s %s" % (self.__class__.__name__, self.__src, self.size)
+
+    def profileName(self):
+        return "%s %s" % (self.__class__.__name__, os.path.basename(self.__src))
+
+    def getImage(self, frame_num):
+        if profiler.current is not None:
+            img = profiler.current.call(self.profileName(), self.readImage, frame_num)
+        else:
+            img = self.readImage(frame_num)
+        if img.mode == "RGBX":
+            # a proxy's frame, the effects want RGB
+            img = img.convert("RGB")
+        return img
+
+    def getPixels(self, frame_num):
+        "with numpy, a proxy's frame is an array over the proxy"
+        source = self.proxied()
+        if source is None or not source.arrays:
+            return self.getImage(frame_num)
+        if profiler.current is not None:
+            return profiler.current.call(self.profileName(), source.getArray, \
+                                            self.frameIndex(frame_num))
+        return source.getArray(self.frameIndex(frame_num))
+
+    def proxied(self):
+        "our proxy, if we read from it"
+        if self.__proxyDirectory is not None:
+            self.proxy = proxy.load(self, self.__proxyDirectory)
+            self.__proxyDirectory = None
+        if self.proxy is not None and self.proxy.size == tuple(self.size):
+            return self.proxy
+        return None
+
+    def readImage(self, frame_num):
+        "from the proxy, or decoded"
+        source = self.proxied()
+        if source is not None:
+            return source.getFrame(self.frameIndex(frame_num))
+        prefetcher.want([self.framePath(frame_num + n) \
+                        for n in range(1, prefetcher.ahead + 1)], self.size)
+        return self.decode(frame_num)
+
+    def decode(self, frame_num):
+        "frame_num from its file"
+        return loadFitted(self.framePath(frame_num), self.size)
+
+    def release(self):
+        "drop the frames of ours that are in frameCache"
+        ImageProvider.release(self)
+        if self.__index is not None:
+            for path in self.__index:
+                for key in self.cacheKeys(path):
+                    frameCache.discard(key)
+
+    def cacheKeys(self, path):
+        "what reading path leaves in frameCache"
+        return [fittedKey(path, self.size)]
+
+    def fingerprint(self, frame_num):
+        return "%s %s %s" % (self.__class__.__name__, self.size, \
+                                fileDigest(self.framePath(frame_num)))
 
 
 class ControlFrameProvider(ImageProvider):
@@ -126,22 +1166,41 @@ class ControlFrameProvider(ImageProvider):
         self.__control = control
     
     def getImage(self, frame_num=None):
-        return self.__control.frame.copy()
+        return self.__control.frame
 
 
 class ColorProvider(ImageProvider):
-    "provides a singel color image"
+    """provides a singel color image
+    getPixels gives it as a backends.Solid, the backends fold blends and
+    pastes of it"""
 
     def __init__(self, size, color, type="RGB"):
         ImageProvider.__init__(self, size)
-        self.__image = Image.new(type, size, color)
+        self.color = color
+        self.type = type
+        self.__images = {} # size -> Solid, there's one more when previewing
     
     def getImage(self, frameNum=None):
-        return self.__image.copy()
+        return backends.asImage(self.getPixels(frameNum))
+
+    def getPixels(self, frameNum=None):
+        size = self.size
+        img = self.__images.get(size)
+        if img is None:
+            img = self.__images[size] = backends.Solid(self.type, size, self.color)
+        return img
+
+    def release(self):
+        self.__images = {}
+
+    def fingerprint(self, frameNum=None):
+        return "ColorProvider %s %s %s" % (self.size, self.color, self.type)
 
 
 class MaskImageProvider(ImageProvider):
-    "Provides a mask"
+    """Provides a mask
+    the image doesn't change, so it's made into a mask once, when it's
+    loaded"""
     
     def __init__(self, size, src, invert, type="L"):
         ImageProvider.__init__(self, size, src)
@@ -149,11 +1208,20 @@ class MaskImageProvider(ImageProvider):
         self.__type = type
     
     def getImage(self, frame_num=None):
-        img = ImageProvider.getImage(self, frame_num)
-        if self.__invert:
-            img = ImageOps.invert(img)
-        img = img.convert(self.__type)
-        return ImageOps.fit(img, self.size)
+        if profiler.current is not None:
+            return profiler.current.call(self.profileName(), self.readImage, frame_num)
+        return self.readImage(frame_num)
+
+    def readImage(self, frame_num=None):
+        return ImageProvider.getImage(self, frame_num)
+
+    def loadDefault(self, size):
+        img = ImageProvider.loadDefault(self, size)
+        return transform(img, maskChain(self.__invert, self.__type) + (("fit", size),))
+
+    def fingerprint(self, frame_num=None):
+        return "%s %s %s" % (ImageProvider.fingerprint(self, frame_num), \
+                                self.__invert, self.__type)
 
 class MaskProvider(FrameProvider):
     "Provides a mask"
@@ -163,12 +1231,23 @@ class MaskProvider(FrameProvider):
         self.__invert = invert
         self.__type = type
     
-    def getImage(self, frame_num=None):
-        img = FrameProvider.getImage(self, frame_num)
-        if self.__invert:
-            img = ImageOps.invert(img)
-        img = img.convert(self.__type)
-        return ImageOps.fit(img, self.size)
+    def decode(self, frame_num):
+        "the frame made into a mask, shared with any MaskProvider of the same file"
+        return loadDerived(self.framePath(frame_num), self.size, self.chain())
+
+    def chain(self):
+        return maskChain(self.__invert, self.__type) + (("fit", self.size),)
+
+    def cacheKeys(self, path):
+        return FrameProvider.cacheKeys(self, path) + \
+                [fittedKey(path, self.size) + (self.chain(),)]
+
+    def proxyKey(self):
+        return "%s %s %s" % (FrameProvider.proxyKey(self), self.__invert, self.__type)
+
+    def fingerprint(self, frame_num):
+        return "%s %s %s" % (FrameProvider.fingerprint(self, frame_num), \
+                                self.__invert, self.__type)
 
 class ImageKeeper(ImageProvider):
     """special kind of image provider that also saves image
@@ -176,19 +1255,43 @@ class ImageKeeper(ImageProvider):
     
     def __init__(self, size):
         ImageProvider.__init__(self, size)
+        self.__image = None
         self._image_fn = self.getRegularImage
          
     def getImage(self, frameNum=None):
+        return backends.asImage(self._image_fn())
+
+    def getPixels(self, frameNum=None):
+        "what the effects left, it can be a Solid or an array"
         return self._image_fn()
 
+    def peekImage(self):
+        "the kept image itself, don't paste into it"
+        return self.__image
+
     def getRegularImage(self):
-        return self.__image.copy()
+        return self.__image
     
+    def readMode(self):
+        "None when getImage hands out the image, (invert, type) for a mask"
+        if self._image_fn == self.getMaskImage:
+            return (self._invert, self._type)
+        return None
+
     def getMaskImage(self):
-        if self._invert:
-            self.__image = ImageOps.invert(self.__image)
-        img = self.__image.convert(self._type)
-        return img
+        if profiler.current is not None:
+            return profiler.current.call("ImageKeeper mask", self.readMaskImage)
+        return self.readMaskImage()
+
+    def readMaskImage(self):
+        if backends.isSolid(self.__image):
+            pixel = self.__image.pixel()
+            if self._invert:
+                pixel = ImageOps.invert(pixel)
+            return backends.solidOf(pixel.convert(self._type), self.__image.size)
+        # the same image is often read more than once, by more than one
+        # effect or over frames nothing changes it
+        return derived(self.__image, maskChain(self._invert, self._type))
     
     def setImage(self, image):
         self.__image = image
@@ -201,29 +1304,49 @@ class ImageKeeper(ImageProvider):
         
 
 class TweenFactory(object):
-    "return the tween of my asking"
+    """return the tween of my asking
+    each is a tween maker, (total_change, number_of_steps) -> tween,
+    the tweens are curves.Curves, see curves.py"""
     def linear(self, total_change, number_of_steps):
         return LinearTween(total_change, number_of_steps)        
 
+    def easeIn(self, total_change, number_of_steps):
+        return curves.Curve(total_change, number_of_steps, "easeIn")
+
+    def easeOut(self, total_change, number_of_steps):
+        return curves.Curve(total_change, number_of_steps, "easeOut")
+
+    def easeInOut(self, total_change, number_of_steps):
+        return curves.Curve(total_change, number_of_steps, "easeInOut")
+
+    def track(self, keyframes):
+        """a tween maker for keyframes [(frame, value[, easing]), ...],
+        frames and values are fractions of the steps and the change,
+        eg [(0, 0), (0.5, 1, "easeOut"), (1, 0)] is there and back"""
+        track = curves.Track(keyframes)
+        return track.scaled
+
 
 class Tween(object):
     "tween interface"
     def getStep(self, frame_num):
         return 0
 
+    def getValue(self, frame_num):
+        "total change after frame_num steps"
+        return 0
+
+    def values(self, frames):
+        "getValue for each of frames"
+        return [self.getValue(frame) for frame in frames]
+
     
-class LinearTween(Tween):
-    "provide tween step, default is linear"
+class LinearTween(curves.Curve):
+    """provide tween step, default is linear
+    a linear Curve, the value at a frame is step * frame"""
     
     def __init__(self, total_change, number_of_steps):
-        Tween.__init__(self)
-        if total_change == 0 or number_of_steps == 0:
-            self.step = 0
-        else:
-            self.step = float(total_change) / number_of_steps
-    
-    def getStep(self, frame_num=None):
-        return self.step
+        curves.Curve.__init__(self, total_change, number_of_steps)
 
         
 class AnimationMaker(object):
@@ -232,38 +1355,377 @@ class AnimationMaker(object):
     To use, Override and Implement buildAnimation(self, animation) only
     """
 
-    def __init__(self, frame_range, dest, size=(720,480)):
+    def __init__(self, frame_range, dest, size=(720,480), format="PNG", \
+                    save_options=None, verbose=True, sink=None, backend="pil", \
+                    block_size=0):
         """
         frameCount - how many to process
         params src, dest - where to grab frames, where to put 'em,
         base is the base filenames for source and dest
+        format, save_options - handed to Image.save, eg {"compress_level": 1}
+        sink - an output.FrameSink, default is a FileSink writing dest
+        backend - "pil" or "numpy", what the effects composite with
+        block_size - frames the blend effects work out at once, numpy only
         """
+        if block_size > 1 and not backends.get(backend).blocks:
+            raise ValueError("blocks need the numpy backend")
         self.frameRange = frame_range
         self.frameCount = frame_range[1] - frame_range[0]
         self.dest = dest
         self.size = size
+        self.format = format
+        self.saveOptions = save_options or {}
+        self.verbose = verbose
+        self.sink = sink
+        self.backend = backend
+        self.blockSize = block_size
+        self.profile = None
+        self.__output = None
+
+    def fileSink(self, writers=1, queue_size=8, writer_processes=False):
+        "one file per frame at dest, saved by writers threads (or processes)"
+        return output.FileSink(self.dest, self.format, self.saveOptions, \
+                    writers, queue_size, writer_processes, self.verbose)
 
     def writeFrame(self, frameNum, img):
         """
-        Writes frame image to file.
+        Hands frame image to the sink.
         """
-        # use me pattern in for dest
-        frameFilename =  self.dest % frameNum
-        print "write " + frameFilename
-        # write file
+        self.__output.write(frameNum, self.frameImage(img))
+
+    def frameImage(self, img):
+        "white when nothing has been committed yet"
         if not(img):
             img = Image.new("RGB", self.size, "White")
-        img.save(frameFilename, 'PNG')
+        return img
+
+    def writeFrames(self, sink, frames, checkpoints=None, control=None, \
+                        sink_position=None):
+        """open sink, write each (frameNum, img) to it in order, close it
+        a frame that is the very image written last time (nothing ran)
+        is handed to sink.repeat instead
+        checkpoints - a checkpoint.Checkpointer, saves control's state
+        when due, sink_position - resume the sink from a checkpoint"""
+        if sink_position is None:
+            sink.open(self)
+        else:
+            sink.resume(self, sink_position)
+        self.__output = sink
+        copies.reset()
+        buffers.reset()
+        startup.check()
+        last = None
+        try:
+            for frame_num, img in frames:
+                active = profiler.current
+                if active is not None:
+                    active.enter("write")
+                if img is not None and img is last:
+                    sink.repeat(frame_num, img)
+                elif isinstance(img, output.StoredFrame):
+                    sink.writeStored(frame_num, img)
+                else:
+                    self.writeFrame(frame_num, img)
+                if active is not None:
+                    active.leave()
+                last = img
+                startup.frameOut()
+                if checkpoints and checkpoints.due(frame_num):
+                    sink.flush()
+                    checkpoints.save(self, control, frame_num, sink)
+        finally:
+            self.__output = None
+            sink.close()
+        if self.verbose:
+            # stderr, a stream sink may have had stdout
+            sys.stderr.write(copies.summary() + "\n")
+            sys.stderr.write(prefetcher.summary() + "\n")
+            sys.stderr.write(buffers.summary() + "\n")
+            sys.stderr.write(startup.summary() + "\n")
     
     def buildAnimation(self, control):
         "override me and attach!"
         print "override me and attach!"
-    
-    def make(self): 
-        "Get goin yee dogs!" 
-        main_control = Controller((self.frameRange[0], self.frameRange[1] + 1))
+
+    def buildControl(self):
+        "a Controller with the animation attached"
+        main_control = Controller((self.frameRange[0], self.frameRange[1] + 1), \
+                                    self.backend, self.blockSize)
         self.buildAnimation(main_control) 
-        for i in range(self.frameRange[0], self.frameRange[1] + 1): 
+        return main_control
+
+    def warmUpFrame(self, main_control, first):
+        """
+        effects only need the frame number, but control.frame and the
+        keepers carry over into the next frame, so the last frame before
+        first where anything happens has to be rendered first, and the
+        frames before it as long as they read what the one before left
+        (a fade from control.frame, say), see carriesOver
+        the frame to render from up to first, None if there's none
+        """
+        warm_up = first - 1
+        while warm_up > self.frameRange[0] and main_control.isIdle(warm_up):
+            warm_up -= 1
+        if warm_up < self.frameRange[0]:
+            return None
+        while warm_up > self.frameRange[0] and (main_control.isIdle(warm_up) or \
+                carriesOver(main_control, main_control.activeAt(warm_up))):
+            warm_up -= 1
+        return warm_up
+
+    def warmUp(self, main_control, first):
+        warm_up = self.warmUpFrame(main_control, first)
+        if warm_up is not None:
+            main_control.seek(warm_up)
+            for frame_num in range(warm_up, first):
+                main_control.notify()
+
+    def frames(self, first, last, main_control=None, cache=None):
+        """
+        render frames first to last, yields (frameNum, img)
+        main_control - already warmed up or restored for first,
+        otherwise a new one is built
+        cache - a rendercache.RenderCache, frames it already has come
+        out as output.StoredFrames
+        """
+        if cache is not None:
+            main_control = main_control or self.buildControl()
+            warm_up = self.warmUpFrame(main_control, first)
+            if warm_up is None:
+                warm_up = first
+            for frame_num, img in cache.frames(self, main_control, warm_up, first, last):
+                yield frame_num, img
+            return
+        if main_control is None:
+            main_control = self.buildControl()
+            self.warmUp(main_control, first)
+        main_control.seek(first)
+        for i in range(first, last + 1): 
             # create image 
             main_control.notify()
-            self.writeFrame(i, main_control.frame) 
+            yield i, main_control.frame
+    
+    def make(self, jobs=1, writers=1, queue_size=8, writer_processes=False, \
+                checkpoint_dir=None, checkpoint_every=250, cache_dir=None, \
+                profile=None): 
+        """Get goin yee dogs!
+        jobs > 1 splits the frames into shards rendered by a process pool
+        writers, queue_size, writer_processes - see fileSink, used when
+        there's no sink of our own
+        checkpoint_dir - save a checkpoint there every checkpoint_every
+        frames so resume can carry on after a crash, needs jobs=1
+        cache_dir - keep every frame there by fingerprint and only render
+        the frames that aren't there yet; a crashed render run again
+        picks up where it was, so no checkpoints with it
+        profile - time every effect, provider read and write, writes a
+        table per act to stderr and saves profile.json, .csv and .folded"""
+        self.profile = profile
+        if profile:
+            profiler.start()
+        try:
+            self.render(jobs, writers, queue_size, writer_processes, \
+                        checkpoint_dir, checkpoint_every, cache_dir)
+        finally:
+            prefetcher.stop()
+            if profile:
+                done = profiler.stop()
+                sys.stderr.write(done.summary() + "\n")
+                done.dump(profile)
+
+    def render(self, jobs, writers, queue_size, writer_processes, \
+                checkpoint_dir, checkpoint_every, cache_dir):
+        "make, less the profiling"
+        sink = self.sink or self.fileSink(writers, queue_size, writer_processes)
+        if checkpoint_dir and jobs > 1:
+            raise ValueError("checkpoints need jobs=1")
+        if checkpoint_dir and cache_dir:
+            raise ValueError("checkpoints and the render cache don't mix")
+        cache = None
+        if cache_dir:
+            cache = rendercache.RenderCache(cache_dir)
+        main_control = self.buildControl()
+        if self.verbose:
+            self.reportPruned(main_control)
+        if jobs <= 1:
+            checkpoints = None
+            if checkpoint_dir:
+                checkpoints = checkpoint.Checkpointer(checkpoint_dir, checkpoint_every)
+            try:
+                self.writeFrames(sink, self.frames(self.frameRange[0], \
+                        self.frameRange[1], main_control, cache), \
+                        checkpoints, main_control)
+            finally:
+                if cache:
+                    cache.close()
+                    if self.verbose:
+                        sys.stderr.write(cache.summary() + "\n")
+            return
+        if sink.shardable:
+            shard_count = jobs * 4
+        else:
+            # frames come back through the pool, keep the shards small
+            shard_count = max(jobs * 4, (self.frameCount + 1) / 25)
+        shard_count = min(shard_count, self.frameCount + 1)
+        bounds = [self.frameRange[0] + (self.frameCount + 1) * n / shard_count \
+                    for n in range(shard_count + 1)]
+        shards = [(self, bounds[n], bounds[n + 1] - 1, sink, cache) \
+                    for n in range(shard_count)]
+        pool = multiprocessing.Pool(jobs)
+        try:
+            if sink.shardable:
+                for frames, totals in pool.map(_renderShard, shards, 1):
+                    _mergeProfile(totals)
+            else:
+                self.writeFrames(sink, _unpackFrames(pool.imap(_renderShard, shards)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def preview(self, dest, scale=0.25, stride=5, format="JPEG", save_options=None, \
+                    sink=None):
+        """a quick look at the whole movie: every stride'th frame at
+        scale times the size, saved to dest % 1, dest % 2, ... (or
+        written to sink) so they play back as a time-lapse
+        effects go by frame number, so every frame is as it would be in
+        the full render, and what's worked out from sizes (slices,
+        squares, slides) comes from the providers' scaled ones
+        JPEG sources are decoded in draft mode, proxies of the wrong
+        size are passed over"""
+        old_scale = setPreviewScale(scale)
+        size = self.size
+        try:
+            self.size = scaledSize(size)
+            if sink is None:
+                directory = os.path.dirname(dest)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                sink = output.FileSink(dest, format, \
+                            save_options or {"quality": 85}, verbose=self.verbose)
+            self.writeFrames(sink, self.previewFrames(stride))
+        finally:
+            prefetcher.stop()
+            self.size = size
+            setPreviewScale(old_scale)
+
+    def previewFrames(self, stride):
+        """every stride'th frame, numbered from 1
+        control.frame carries over from stride frames back"""
+        main_control = self.buildControl()
+        # a block is the next frames, we'd only use one of them
+        main_control.blockSize = 0
+        frame_nums = range(self.frameRange[0], self.frameRange[1] + 1, stride)
+        for n, frame_num in enumerate(frame_nums):
+            main_control.seek(frame_num)
+            main_control.notify()
+            yield n + 1, main_control.frame
+
+    def reportPruned(self, main_control):
+        "what the render will skip, by act and effect, on stderr"
+        for observer, why, spans in main_control.pruned(self.frameRange[0], \
+                                                        self.frameRange[1]):
+            act, name = profiler.effectName(main_control, observer)
+            frames = sum([last - first + 1 for first, last in spans])
+            shown = ", ".join(["%d-%d" % span for span in spans[:4]])
+            if len(spans) > 4:
+                shown += ", ..."
+            sys.stderr.write("pruned %s %s, %s for %d frames: %s\n" % \
+                                (act, name, why, frames, shown))
+
+    def farm(self, directory, workers=0, chunk_size=100, lease=120, retries=3, \
+                writers=1, queue_size=8):
+        """render through a farm in directory (see farm.py), with workers
+        worker processes here, other boxes join in with work(directory)
+        the frames go to our sink in order as chunks come in"""
+        sink = self.sink or self.fileSink(writers, queue_size)
+        farm.Farm(directory, self, chunk_size, lease, retries).run(sink, workers)
+
+    def work(self, directory):
+        "be a worker for the farm in directory till it's out of chunks"
+        try:
+            return farm.Farm(directory, self).work()
+        finally:
+            prefetcher.stop()
+
+    def resume(self, checkpoint_dir, checkpoint_every=250, writers=1, \
+                queue_size=8, writer_processes=False):
+        """carry on from the newest good checkpoint in checkpoint_dir,
+        or start from scratch if there isn't one"""
+        checkpoints = checkpoint.Checkpointer(checkpoint_dir, checkpoint_every)
+        state = checkpoints.latest(self)
+        if state is None:
+            if self.verbose:
+                sys.stderr.write("no checkpoint in %s, starting from the top\n" % \
+                                    checkpoint_dir)
+            return self.make(1, writers, queue_size, writer_processes, \
+                                checkpoint_dir, checkpoint_every)
+        if self.verbose:
+            sys.stderr.write("resuming after frame %d\n" % state["frame"])
+        sink = self.sink or self.fileSink(writers, queue_size, writer_processes)
+        main_control = self.buildControl()
+        checkpoints.restore(state, main_control)
+        self.writeFrames(sink, \
+            self.frames(state["frame"] + 1, self.frameRange[1], main_control), \
+            checkpoints, main_control, state["sink"])
+
+
+def _renderShard(shard):
+    """pool worker, renders one (maker, first, last, sink, cache) shard
+    writes it if the sink is shardable, otherwise sends the frames back,
+    returns (frames or None, profiler totals or None)"""
+    maker, first, last, sink, cache = shard
+    if getattr(maker, "profile", None):
+        profiler.start()
+    if sink.shardable:
+        # pool workers can't start pools of their own
+        sink.processes = False
+        try:
+            maker.writeFrames(sink, maker.frames(first, last, None, cache))
+        finally:
+            if cache:
+                cache.close()
+        return None, _shardProfile()
+    # the frames go back through the pool, stdout may be the stream itself
+    sys.stdout = sys.stderr
+    frames = []
+    previous = None
+    for frame_num, img in maker.frames(first, last, None, cache):
+        if img is not None and img is previous and frames:
+            frames.append((frame_num, "repeat", None, None))
+        elif isinstance(img, output.StoredFrame):
+            img = img.image()
+            frames.append((frame_num, img.mode, img.size, img.tostring()))
+        elif img:
+            frames.append((frame_num, img.mode, img.size, img.tostring()))
+        else:
+            frames.append((frame_num, None, None, None))
+        previous = img
+    if cache:
+        cache.close()
+    return frames, _shardProfile()
+
+
+def _shardProfile():
+    done = profiler.stop()
+    if done is None:
+        return None
+    return done.totals
+
+
+def _mergeProfile(totals):
+    if totals and profiler.current is not None:
+        profiler.current.merge(totals)
+
+
+def _unpackFrames(shards):
+    "(frameNum, img) for the frames in shards, in order"
+    img = None
+    for frames, totals in shards:
+        _mergeProfile(totals)
+        for frame_num, mode, size, data in frames:
+            if mode == "repeat":
+                pass
+            elif mode:
+                img = Image.fromstring(mode, size, data)
+            else:
+                img = None
+            yield frame_num, img
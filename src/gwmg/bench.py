@@ -0,0 +1,224 @@
+# gwmg.bench.py
+
+"""
+Benchmarks that don't need the real sources: deterministic synthetic
+sequences and images, every Effect timed on its own at a few sizes,
+and results kept as a JSON baseline that later runs are checked against
+    python bench.py [--sizes 180x120,360x240,720x480] [--frames 20]
+                    [--baseline bench.json] [--save] [--threshold 0.25]
+bike/bench.py times a scaled down movie the same way
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import tempfile
+import Image, ImageDraw
+import base
+import Effects
+
+SOURCE_SIZE = (800, 600)
+
+
+def makeImage(size, seed, mode="RGB"):
+    "a picture of blobs, the same every time for a seed"
+    rand = random.Random(seed)
+    def color():
+        return (rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255))
+    img = Image.new("RGB", size, color())
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    for n in range(8):
+        x, y = rand.randint(0, w), rand.randint(0, h)
+        draw.ellipse((x, y, x + rand.randint(w / 20, w / 2), \
+                        y + rand.randint(h / 20, h / 2)), fill=color())
+    if mode != "RGB":
+        img = img.convert(mode)
+    return img
+
+
+def makeSequence(pattern, count, seed, size=SOURCE_SIZE):
+    """
+    pattern % 1 .. pattern % count, things moving across blobs, with
+    the colours the pixel swappers look for in them
+    """
+    directory = os.path.dirname(pattern)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    w, h = size
+    for n in range(1, count + 1):
+        img = makeImage(size, seed)
+        draw = ImageDraw.Draw(img)
+        x = n * w / (count + 1)
+        draw.rectangle((x, h / 6, x + w / 10, h * 2 / 3), fill=(116, 125, 111))
+        draw.rectangle((w - x, h / 2, w - x + w / 8, h * 5 / 6), fill=(192, 125, 68))
+        draw.ellipse((x / 2, x / 3, x / 2 + w / 6, x / 3 + h / 6), fill=(255, 0, 0))
+        img.save(pattern % n)
+        seed += 1
+
+
+def sources(directory, count=12):
+    "a sequence and an image under directory, returns (sequence, image)"
+    sequence = os.path.join(directory, "frames", "frame%04d.png")
+    image = os.path.join(directory, "image.png")
+    if not os.path.exists(sequence % count):
+        makeSequence(sequence, count, 1)
+    if not os.path.exists(image):
+        makeImage(SOURCE_SIZE, 99).save(image)
+    return sequence, image
+
+
+def effectCases(sequence, image, size):
+    """
+    (name, effect maker) for every Effect, an effect maker takes
+    (frame_range, keeper) and the keeper starts out with a frame in it
+    """
+    tween = base.TweenFactory().linear
+    frames = base.FrameProvider(size, sequence)
+    mask = base.MaskProvider(size, sequence, True)
+    still = base.ImageProvider(size, image)
+    red = base.ColorProvider(size, "Red")
+    white = base.ColorProvider(size, "White")
+    def group(frame_range, keeper):
+        return Effects.ColorSwapperGroup((\
+            Effects.ColorForColorPixelSwapper(frame_range, keeper, (keeper,), \
+                (255, 0, 0), (116, 125, 111), 30), \
+            Effects.ColorForColorPixelSwapper(frame_range, keeper, (keeper,), \
+                (255, 192, 203), (192, 125, 68), 17)))
+    return [
+        ("ColorScale", lambda r, k: Effects.ColorScale(r, k, (frames,), "White", "Red")),
+        ("Mask", lambda r, k: Effects.Mask(r, k, (still, k, mask))),
+        ("FadeInOutPercent", lambda r, k: Effects.FadeInOutPercent(r, k, \
+            (white, frames), (30, 40, 30), tween)),
+        ("SliceRepeaterPercentSlide", lambda r, k: Effects.SliceRepeaterPercentSlide(\
+            r, k, (frames,), (10, 40, 10, 10, 30), (r[1] - r[0]) / 2)),
+        ("Commit", lambda r, k: Effects.Commit(r, k)),
+        ("ColorForColorPixelSwapper", lambda r, k: Effects.ColorForColorPixelSwapper(\
+            r, k, (k,), (255, 0, 0), (116, 125, 111), 30)),
+        ("ColorSwapperGroup", group),
+        ("SimpleFader", lambda r, k: Effects.SimpleFader(r, k, (red, frames), tween)),
+        ("CollapsingSquares", lambda r, k: Effects.CollapsingSquares(r, k, (k,), 15)),
+        ("SliceRepeaterPercent", lambda r, k: Effects.SliceRepeaterPercent(r, k, \
+            (frames, k, mask), (33, 59, 8), (True, True, False))),
+    ]
+
+
+def timeEffect(make, size, fill, frames, repeat=3, backend="pil"):
+    """
+    ms a frame, best of repeat runs over frames frames, after one run to
+    warm the caches, so it's the effect and not the decoding
+    fill provides what's in the keeper before each frame
+    """
+    best = None
+    for run in range(repeat + 1):
+        control = base.Controller((1, frames + 1), backend)
+        # the providers are used again next run
+        control.releasing = False
+        keeper = base.ImageKeeper(size)
+        control.attach(make((1, frames + 1), keeper))
+        started = time.time()
+        for n in range(frames):
+            # what was kept going in, as it would be in a chain
+            keeper.setImage(fill.getImage(n))
+            control.notify()
+        elapsed = 1000 * (time.time() - started) / frames
+        if run and (best is None or elapsed < best):
+            best = elapsed
+    return best
+
+
+def parseSize(text):
+    w, h = text.lower().split("x")
+    return (int(w), int(h))
+
+
+def benchEffects(directory, sizes, frames=20, repeat=3, backend="pil", verbose=True):
+    "{'effect Name WxH': ms a frame}"
+    sequence, image = sources(directory)
+    results = {}
+    for size in sizes:
+        fill = base.FrameProvider(size, sequence)
+        for name, make in effectCases(sequence, image, size):
+            key = "effect %s %dx%d" % ((name,) + tuple(size))
+            if backend != "pil":
+                key += " " + backend
+            results[key] = timeEffect(make, size, fill, frames, repeat, backend)
+            if verbose:
+                print "%-50s %8.2fms" % (key, results[key])
+    return results
+
+
+def loadBaseline(path):
+    if not os.path.exists(path):
+        return {}
+    return json.load(open(path))["results"]
+
+
+def saveBaseline(path, results):
+    "merge results into the baseline at path"
+    baseline = loadBaseline(path)
+    baseline.update(results)
+    out = open(path, "w")
+    try:
+        json.dump({"version": 1, "results": baseline}, out, indent=1, sort_keys=True)
+    finally:
+        out.close()
+
+
+def regressions(results, baseline, threshold=0.25):
+    "(name, baseline ms, ms) for results more than threshold slower than baseline"
+    slower = []
+    for name in sorted(results):
+        if name in baseline and results[name] > baseline[name] * (1 + threshold):
+            slower.append((name, baseline[name], results[name]))
+    return slower
+
+
+def report(results, baseline_path, threshold=0.25, save=False):
+    """
+    check results against the baseline, save them if asked,
+    returns how many regressed
+    """
+    slower = regressions(results, loadBaseline(baseline_path), threshold)
+    for name, before, now in slower:
+        print "REGRESSION %s: %.2fms, was %.2fms (+%.0f%%)" % \
+                (name, now, before, 100 * (now / before - 1))
+    if save:
+        saveBaseline(baseline_path, results)
+        print "saved %d results to %s" % (len(results), baseline_path)
+    return len(slower)
+
+
+def options(argv, defaults):
+    "--name value and --flag, over defaults"
+    opts = dict(defaults)
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith("--"):
+            raise ValueError("what's %r?" % arg)
+        name = arg[2:]
+        if isinstance(opts.get(name), bool):
+            opts[name] = True
+        else:
+            opts[name] = args.pop(0)
+    return opts
+
+
+DEFAULTS = {"sizes": "180x120,360x240,720x480", "frames": "20", "repeat": "3", \
+            "backend": "pil", "baseline": "bench.json", "threshold": "0.25", \
+            "sources": "", "save": False}
+
+
+def main(argv):
+    opts = options(argv, DEFAULTS)
+    directory = opts["sources"] or os.path.join(tempfile.gettempdir(), "gwmg-bench")
+    results = benchEffects(directory, [parseSize(s) for s in opts["sizes"].split(",")], \
+                int(opts["frames"]), int(opts["repeat"]), opts["backend"])
+    return report(results, opts["baseline"], float(opts["threshold"]), opts["save"])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) and 1 or 0)
@@ -0,0 +1,124 @@
+# gwmg.checkpoint.py
+
+import os
+import glob
+import cPickle
+import Image
+import backends
+
+VERSION = 1
+
+
+def packImage(img):
+    "an image, a Solid or an array from the numpy backend, as plain values"
+    if img is None:
+        return None
+    if backends.isSolid(img):
+        return ("solid",) + img.key()
+    if backends.isArray(img):
+        return ("array", img.dtype.str, img.shape, img.tostring())
+    return (img.mode, img.size, img.tostring())
+
+
+def unpackImage(packed):
+    if packed is None:
+        return None
+    if packed[0] == "array":
+        kind, dtype, shape, data = packed
+        return backends.numpy.fromstring(data, dtype).reshape(shape)
+    if packed[0] == "solid":
+        kind, mode, size, color = packed
+        return backends.Solid(mode, size, color)
+    mode, size, data = packed
+    return Image.fromstring(mode, size, data)
+
+
+def keepers(control):
+    """
+    the keepers attached effects write to or read from, in attach order
+    a keeper is anything with peekImage and setImage
+    """
+    found = []
+    for observer in control._observers:
+        candidates = [getattr(observer, "keeper", None)]
+        candidates.extend(getattr(observer, "providers", None) or ())
+        for candidate in candidates:
+            if hasattr(candidate, "peekImage") and hasattr(candidate, "setImage") \
+                    and not [k for k in found if k is candidate]:
+                found.append(candidate)
+    return found
+
+
+class Checkpointer(object):
+    """
+    Saves what a render carries from frame to frame, every `every` frames
+    effects, tweens and providers work from the frame number alone,
+    so that's the keepers, control.frame and where the sink got to
+    keeps the newest `keep` checkpoints in directory
+    """
+
+    def __init__(self, directory, every=250, keep=2):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def due(self, frame_num):
+        return self.every > 0 and frame_num % self.every == 0
+
+    def path(self, frame_num):
+        return os.path.join(self.directory, "checkpoint-%06d.pkl" % frame_num)
+
+    def paths(self):
+        "checkpoint files, newest first"
+        paths = glob.glob(os.path.join(self.directory, "checkpoint-*.pkl"))
+        paths.sort()
+        paths.reverse()
+        return paths
+
+    def save(self, maker, control, frame_num, sink):
+        "frame_num is done and flushed to sink"
+        state = {"version": VERSION,
+                 "frameRange": tuple(maker.frameRange),
+                 "size": tuple(maker.size),
+                 "frame": frame_num,
+                 "control": packImage(control.frame),
+                 "keepers": [packImage(k.peekImage()) for k in keepers(control)],
+                 "sink": sink.position()}
+        path = self.path(frame_num)
+        tmp = path + ".tmp"
+        out = open(tmp, "wb")
+        try:
+            cPickle.dump(state, out, cPickle.HIGHEST_PROTOCOL)
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+        os.rename(tmp, path)
+        for old in self.paths()[self.keep:]:
+            os.remove(old)
+
+    def latest(self, maker):
+        "the newest checkpoint that loads and belongs to maker, or None"
+        for path in self.paths():
+            try:
+                state = cPickle.load(open(path, "rb"))
+            except Exception:
+                continue
+            if state.get("version") == VERSION and \
+                    state.get("frameRange") == tuple(maker.frameRange) and \
+                    state.get("size") == tuple(maker.size):
+                return state
+        return None
+
+    def restore(self, state, control):
+        "put the keepers and control.frame back, control is freshly built"
+        found = keepers(control)
+        if len(found) != len(state["keepers"]):
+            raise ValueError("checkpoint has %d keepers, animation has %d" % \
+                    (len(state["keepers"]), len(found)))
+        for keeper, packed in zip(found, state["keepers"]):
+            keeper.setImage(unpackImage(packed))
+        control.frame = unpackImage(state["control"])
+        control.seek(state["frame"] + 1)
@@ -0,0 +1,181 @@
+# gwmg.curves.py
+
+"""
+Curves are tweens that go straight to the value at a frame, there's no
+stepping through the frames before it
+a Curve is total_change over number_of_steps frames, linear or eased,
+a Track is a run of keyframes with a curve between each two
+both work their values out over their frames once, into a table, so
+getValue is an index and values(frames) is one call for a whole range
+(an array with numpy)
+they're what TweenFactory hands out, see base.py
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# t from 0 to 1 -> how far along, 0 to 1
+def linear(t):
+    return t
+
+def easeIn(t):
+    return t * t
+
+def easeOut(t):
+    return t * (2 - t)
+
+def easeInOut(t):
+    return t * t * (3 - 2 * t)
+
+EASINGS = {"linear": linear, "easeIn": easeIn, "easeOut": easeOut, \
+            "easeInOut": easeInOut}
+
+
+class Table(object):
+    """
+    values of a function at frames 0 up to last, worked out in one go,
+    frames off the table (past it, or not whole) are worked out as asked
+    """
+
+    def __init__(self, function, last):
+        self.function = function
+        count = max(0, int(math.floor(last))) + 1
+        if numpy is not None:
+            self.values = function(numpy.arange(count, dtype=numpy.float64))
+            if numpy.ndim(self.values) == 0:
+                self.values = numpy.repeat(float(self.values), count)
+        else:
+            self.values = [function(float(frame)) for frame in range(count)]
+        self.count = count
+
+    def get(self, frame):
+        index = int(frame)
+        if index == frame and 0 <= index < self.count:
+            return float(self.values[index])
+        return float(self.function(float(frame)))
+
+    def getMany(self, frames):
+        "values at frames, an array with numpy"
+        if numpy is None:
+            return [self.get(frame) for frame in frames]
+        frames = numpy.asarray(frames, dtype=numpy.float64)
+        index = frames.astype(numpy.int64)
+        if len(frames) and (index == frames).all() and \
+                index.min() >= 0 and index.max() < self.count:
+            return numpy.asarray(self.values)[index]
+        return numpy.array([self.get(frame) for frame in frames])
+
+
+class Curve(object):
+    """
+    total_change over number_of_steps frames, getValue(frame) is how
+    much it's changed by frame
+    linear goes on past the end like LinearTween always did, the eased
+    ones stop at total_change
+    """
+
+    def __init__(self, total_change, number_of_steps, easing="linear"):
+        self.totalChange = total_change
+        self.steps = number_of_steps
+        self.easing = easing
+        self.__ease = EASINGS[easing]
+        if total_change == 0 or number_of_steps == 0:
+            self.step = 0
+        else:
+            self.step = float(total_change) / number_of_steps
+        self.__table = Table(self.compute, number_of_steps)
+
+    def compute(self, frame):
+        "the value at frame, worked out, frame can be an array"
+        if self.easing == "linear" or not self.step:
+            # step * frame, not the step added up frame by frame like the
+            # effects used to, the floats can differ in the last bit and
+            # a frame where that crosses a rounding comes out a level off
+            return self.step * frame
+        if numpy is not None and isinstance(frame, numpy.ndarray):
+            t = numpy.clip(frame / float(self.steps), 0.0, 1.0)
+        else:
+            t = min(1.0, max(0.0, frame / float(self.steps)))
+        return self.totalChange * self.__ease(t)
+
+    def getStep(self, frame_num=None):
+        "the change into frame_num, the step for a linear one"
+        if frame_num is None or self.easing == "linear":
+            return self.step
+        return self.getValue(frame_num) - self.getValue(frame_num - 1)
+
+    def getValue(self, frame_num):
+        return self.__table.get(frame_num)
+
+    def values(self, frames):
+        "getValue for each of frames"
+        return self.__table.getMany(frames)
+
+    def describe(self):
+        return "<Curve %r %r %s>" % (self.totalChange, self.steps, self.easing)
+
+
+class Track(object):
+    """
+    keyframes [(frame, value), ...] or (frame, value, easing) for the
+    easing from the keyframe before, linear if there's none
+    the value holds before the first keyframe and after the last
+    """
+
+    def __init__(self, keyframes):
+        keyframes = [tuple(key) + ("linear",) * (3 - len(key)) for key in keyframes]
+        keyframes.sort(key=lambda key: key[0])
+        if not keyframes:
+            raise ValueError("a track needs a keyframe")
+        self.keyframes = keyframes
+        self.__frames = [key[0] for key in keyframes]
+        self.__table = Table(self.compute, keyframes[-1][0])
+
+    def segment(self, frame):
+        "the keyframes either side of frame"
+        n = 0
+        while n < len(self.__frames) - 1 and self.__frames[n + 1] < frame:
+            n += 1
+        return self.keyframes[n], self.keyframes[min(n + 1, len(self.keyframes) - 1)]
+
+    def computeOne(self, frame):
+        (start, first, ignored), (end, last, easing) = self.segment(frame)
+        if frame <= start or end == start:
+            return float(first)
+        if frame >= end:
+            return float(last)
+        t = (frame - start) / float(end - start)
+        return first + (last - first) * EASINGS[easing](t)
+
+    def compute(self, frame):
+        "the value at frame, frame can be an array"
+        if numpy is not None and isinstance(frame, numpy.ndarray):
+            return numpy.array([self.computeOne(f) for f in frame])
+        return self.computeOne(frame)
+
+    def getStep(self, frame_num=None):
+        if frame_num is None:
+            return 0
+        return self.getValue(frame_num) - self.getValue(frame_num - 1)
+
+    def getValue(self, frame_num):
+        return self.__table.get(frame_num)
+
+    def values(self, frames):
+        return self.__table.getMany(frames)
+
+    def scaled(self, total_change, number_of_steps):
+        """
+        a copy with the frames and values taken as fractions of
+        number_of_steps and total_change, so it fits an effect's range
+        """
+        return Track([(frame * number_of_steps, value * total_change, easing) \
+                        for frame, value, easing in self.keyframes])
+
+    def describe(self):
+        return "<Track %r>" % (self.keyframes,)
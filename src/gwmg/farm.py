@@ -0,0 +1,315 @@
+# gwmg.farm.py
+
+"""
+Rendering on more than one machine, through a directory they all see
+the coordinator splits the frame range into chunks, workers (here or on
+other boxes, running the same movie) lease a chunk at a time, render it
+from its first frame, warming up like any shard does, and publish it,
+the coordinator hands the frames to the sink in order as chunks land
+the directory:
+    plan.json               the frame range, chunk size, lease and retries
+    queue/FIRST-LAST        chunks to do, the file holds how many tries so far
+    leased/FIRST-LAST@WHO   taken by a worker, touched every frame it renders
+    work/FIRST-LAST@WHO/    the frames on their way
+    done/FIRST-LAST/        the finished chunk, renamed in from work
+a lease that isn't touched for `lease` seconds is a dead worker's, the
+chunk goes back on the queue, a chunk that fails `retries` times stops
+the farm
+done chunks stay, a coordinator started again on the same frames only
+waits for the rest, remove the directory to start over
+everything moves by rename, so the directory has to be on one
+filesystem, and the boxes' clocks should roughly agree
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import socket
+import traceback
+import multiprocessing
+import output
+
+VERSION = 1
+
+
+class LeaseLost(Exception):
+    "the chunk was given to someone else, we took too long"
+
+
+def chunkName(first, last):
+    return "%06d-%06d" % (first, last)
+
+
+def chunkRange(name):
+    first, last = name.split("@")[0].split("-")
+    return int(first), int(last)
+
+
+def workerName():
+    return "%s.%d" % (socket.gethostname(), os.getpid())
+
+
+class Farm(object):
+    """
+    a farm in directory for maker's frames
+    chunk_size frames to a chunk, lease seconds before a silent worker's
+    chunk is handed out again, retries tries before a chunk stops it all
+    """
+
+    def __init__(self, directory, maker, chunk_size=100, lease=120, retries=3, poll=0.5):
+        self.directory = directory
+        self.maker = maker
+        self.chunkSize = chunk_size
+        self.lease = lease
+        self.retries = retries
+        self.poll = poll
+
+    def path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def chunks(self):
+        "(first, last) of each chunk, in order"
+        first, last = self.maker.frameRange
+        return [(start, min(start + self.chunkSize - 1, last)) \
+                    for start in range(first, last + 1, self.chunkSize)]
+
+    def plan(self):
+        """
+        queue the chunks, or take up the farm that's there if it's for
+        the same frames, chunks already done or on the go are left be
+        """
+        settings = {"version": VERSION, "frameRange": list(self.maker.frameRange), \
+                    "chunkSize": self.chunkSize, "lease": self.lease, \
+                    "retries": self.retries}
+        for name in ("queue", "leased", "work", "done"):
+            if not os.path.isdir(self.path(name)):
+                os.makedirs(self.path(name))
+        if os.path.exists(self.path("plan.json")):
+            planned = json.load(open(self.path("plan.json")))
+            if planned["frameRange"] != settings["frameRange"] or \
+                    planned["chunkSize"] != settings["chunkSize"]:
+                raise ValueError("%s has a farm for frames %d-%d already" % \
+                        ((self.directory,) + tuple(planned["frameRange"])))
+        else:
+            self.__writeJSON(self.path("plan.json"), settings)
+        taken = set([chunkRange(name) for name in os.listdir(self.path("leased")) + \
+                        os.listdir(self.path("done")) + os.listdir(self.path("queue")) \
+                        if not name.endswith(".part")])
+        for first, last in self.chunks():
+            if (first, last) not in taken:
+                self.__writeTries(self.path("queue", chunkName(first, last)), 0)
+
+    def join(self, wait=60):
+        "take on the farm's settings from its plan.json, for a worker"
+        waited = 0
+        while not os.path.exists(self.path("plan.json")):
+            if waited >= wait:
+                raise IOError("no farm in %s" % self.directory)
+            time.sleep(self.poll)
+            waited += self.poll
+        planned = json.load(open(self.path("plan.json")))
+        if planned["version"] != VERSION:
+            raise ValueError("%s is a version %s farm" % (self.directory, planned["version"]))
+        if tuple(planned["frameRange"]) != tuple(self.maker.frameRange):
+            raise ValueError("the farm is rendering frames %d-%d, we'd render %d-%d" % \
+                    (tuple(planned["frameRange"]) + tuple(self.maker.frameRange)))
+        self.chunkSize = planned["chunkSize"]
+        self.lease = planned["lease"]
+        self.retries = planned["retries"]
+
+    def __writeJSON(self, path, value):
+        out = open(path + ".part", "w")
+        try:
+            json.dump(value, out)
+        finally:
+            out.close()
+        os.rename(path + ".part", path)
+
+    def __writeTries(self, path, tries):
+        out = open(path + ".part", "w")
+        try:
+            out.write("%d\n" % tries)
+        finally:
+            out.close()
+        os.rename(path + ".part", path)
+
+    def tries(self, path):
+        try:
+            return int(open(path).read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    # the queue
+
+    def claim(self, worker):
+        "lease the first chunk that's waiting, its name or None"
+        for name in sorted(os.listdir(self.path("queue"))):
+            if name.endswith(".part"):
+                continue
+            queued = self.path("queue", name)
+            if os.path.isdir(self.path("done", name)):
+                # done, its worker died before it let go of the lease
+                self.__remove(queued)
+                continue
+            if self.tries(queued) >= self.retries:
+                continue
+            try:
+                # the lease runs from now, rename keeps the time
+                os.utime(queued, None)
+                os.rename(queued, self.path("leased", "%s@%s" % (name, worker)))
+            except OSError:
+                continue # someone else got it
+            return name
+        return None
+
+    def renew(self, name, worker):
+        "touch the lease, LeaseLost if it's gone"
+        try:
+            os.utime(self.path("leased", "%s@%s" % (name, worker)), None)
+        except OSError:
+            raise LeaseLost(name)
+
+    def release(self, name, worker, failed=True):
+        "give a chunk back, a try down if it failed, False if it's gone"
+        leased = self.path("leased", "%s@%s" % (name, worker))
+        tries = self.tries(leased) + (failed and 1 or 0)
+        try:
+            os.rename(leased, self.path("queue", name))
+        except OSError:
+            return False
+        self.__writeTries(self.path("queue", name), tries)
+        shutil.rmtree(self.path("work", "%s@%s" % (name, worker)), True)
+        return True
+
+    def reclaim(self):
+        "put chunks with leases older than lease seconds back on the queue"
+        now = time.time()
+        for entry in os.listdir(self.path("leased")):
+            try:
+                touched = os.stat(self.path("leased", entry)).st_mtime
+            except OSError:
+                continue
+            if now - touched > self.lease:
+                name, worker = entry.split("@", 1)
+                if self.release(name, worker):
+                    sys.stderr.write("%s's lease on %s ran out\n" % (worker, name))
+
+    def failed(self):
+        "names of chunks that have used up their tries"
+        return [name for name in os.listdir(self.path("queue")) \
+                if not name.endswith(".part") and \
+                    self.tries(self.path("queue", name)) >= self.retries]
+
+    def busy(self):
+        "chunks are waiting or leased"
+        return bool([name for name in os.listdir(self.path("queue")) \
+                        if not name.endswith(".part") and name not in self.failed()]) \
+                or bool(os.listdir(self.path("leased")))
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # workers
+
+    def work(self):
+        "render chunks until there are none left, returns how many it did"
+        self.join()
+        worker = workerName()
+        rendered = 0
+        while True:
+            self.reclaim()
+            name = self.claim(worker)
+            if name is None:
+                if not self.busy():
+                    return rendered
+                time.sleep(self.poll)
+                continue
+            try:
+                self.renderChunk(name, worker)
+                rendered += 1
+            except LeaseLost:
+                sys.stderr.write("lost %s, it's someone else's now\n" % name)
+                shutil.rmtree(self.path("work", "%s@%s" % (name, worker)), True)
+            except Exception:
+                traceback.print_exc()
+                self.release(name, worker)
+
+    def renderChunk(self, name, worker):
+        "render, save and publish chunk name"
+        first, last = chunkRange(name)
+        staging = self.path("work", "%s@%s" % (name, worker))
+        if not os.path.isdir(staging):
+            os.makedirs(staging)
+        sink = output.FileSink(os.path.join(staging, "%06d"), self.maker.format, \
+                    self.maker.saveOptions, verbose=False)
+        def frames():
+            # the control's built and warmed up for first, like a shard
+            for frame_num, img in self.maker.frames(first, last):
+                self.renew(name, worker)
+                yield frame_num, img
+        self.maker.writeFrames(sink, frames())
+        self.renew(name, worker)
+        try:
+            os.rename(staging, self.path("done", name))
+        except OSError:
+            # someone else finished it first
+            shutil.rmtree(staging, True)
+        self.__remove(self.path("leased", "%s@%s" % (name, worker)))
+        if self.maker.verbose:
+            sys.stderr.write("rendered %s\n" % name)
+
+    # the coordinator
+
+    def assemble(self, processes=None):
+        """
+        (frameNum, StoredFrame) for every frame in order, as chunks are
+        done, local worker processes (a list, changed in place) that
+        died, or finished while there's work again, are replaced
+        """
+        processes = processes or []
+        for first, last in self.chunks():
+            name = chunkName(first, last)
+            while not os.path.isdir(self.path("done", name)):
+                failed = self.failed()
+                if failed:
+                    raise RuntimeError("chunk %s failed %d times" % (failed[0], self.retries))
+                self.reclaim()
+                for n, process in enumerate(processes):
+                    if not process.is_alive() and (process.exitcode != 0 or self.busy()):
+                        if process.exitcode != 0:
+                            sys.stderr.write("worker %d died, starting another\n" % \
+                                                process.pid)
+                        processes[n] = self.startWorker()
+                time.sleep(self.poll)
+            for frame_num in range(first, last + 1):
+                yield frame_num, output.StoredFrame(self.path("done", name, \
+                                    "%06d" % frame_num), self.maker.format)
+
+    def startWorker(self):
+        process = multiprocessing.Process(target=self.work)
+        process.daemon = True
+        process.start()
+        return process
+
+    def run(self, sink, workers=0):
+        """
+        plan, start workers local worker processes (0 when they're all
+        elsewhere) and write the frames to sink as they come in
+        """
+        self.plan()
+        self.processes = [self.startWorker() for n in range(workers)]
+        try:
+            self.maker.writeFrames(sink, self.assemble(self.processes))
+        finally:
+            for process in self.processes:
+                process.join(self.poll)
+                if process.is_alive():
+                    process.terminate()
+        if self.maker.verbose:
+            sys.stderr.write("farm done, %d chunks in %s\n" % \
+                                (len(self.chunks()), self.directory))
@@ -0,0 +1,360 @@
+# gwmg.output.py
+
+import os
+import sys
+import math
+import shutil
+import time
+import threading
+import Queue
+import multiprocessing
+import Image
+
+
+def saveImage(filename, img, format="PNG", options=None, atomic=False):
+    """encode and save one frame, returns how long it took
+    atomic saves to a .part file and renames it into place"""
+    start = time.time()
+    if atomic:
+        img.save(filename + ".part", format, **(options or {}))
+        os.rename(filename + ".part", filename)
+    else:
+        img.save(filename, format, **(options or {}))
+    return time.time() - start
+
+
+def _saveString(job):
+    "process worker, frames travel as strings"
+    filename, mode, size, data, format, options, atomic = job
+    return saveImage(filename, Image.fromstring(mode, size, data), format, \
+                        options, atomic)
+
+
+class StoredFrame(object):
+    "a frame that's already in a file, eg in the render cache"
+
+    def __init__(self, path, format="PNG"):
+        self.path = path
+        self.format = format
+
+    def image(self):
+        img = Image.open(self.path)
+        img.load()
+        return img
+
+
+class FrameWriter(object):
+    """
+    Saves frames off the render thread
+    workers threads (or processes) do the encoding, write blocks once
+    queue_size frames are waiting, so rendering can't run away with memory
+    workers=0 saves right away like it always did
+    """
+
+    def __init__(self, workers=1, queue_size=8, format="PNG", options=None, \
+                    processes=False, atomic=False):
+        self.format = format
+        self.options = options or {}
+        self.atomic = atomic
+        self.queueSize = max(1, queue_size)
+        self.latencies = [] # enqueue to saved, seconds
+        self.depths = []    # frames waiting when one more came in
+        self.__error = None
+        self.__threads = []
+        self.__pool = None
+        self.__pending = []
+        if workers and processes:
+            self.__pool = multiprocessing.Pool(workers)
+        elif workers:
+            self.__queue = Queue.Queue(self.queueSize)
+            for n in range(workers):
+                thread = threading.Thread(target=self.__work)
+                thread.setDaemon(True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def __work(self):
+        while True:
+            job = self.__queue.get()
+            try:
+                if job is None:
+                    return
+                filename, img, queued = job
+                try:
+                    saveImage(filename, img, self.format, self.options, self.atomic)
+                    self.latencies.append(time.time() - queued)
+                except Exception, e:
+                    self.__error = e
+            finally:
+                self.__queue.task_done()
+
+    def __check(self):
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def write(self, filename, img):
+        self.__check()
+        if self.__pool:
+            self.depths.append(len(self.__pending))
+            while len(self.__pending) >= self.queueSize:
+                self.__collect()
+            job = (filename, img.mode, img.size, img.tostring(), \
+                    self.format, self.options, self.atomic)
+            self.__pending.append((time.time(), \
+                    self.__pool.apply_async(_saveString, (job,))))
+        elif self.__threads:
+            self.depths.append(self.__queue.qsize())
+            self.__queue.put((filename, img, time.time()))
+        else:
+            self.depths.append(0)
+            self.latencies.append(saveImage(filename, img, self.format, \
+                                    self.options, self.atomic))
+
+    def __collect(self):
+        queued, result = self.__pending.pop(0)
+        result.get()
+        self.latencies.append(time.time() - queued)
+
+    def flush(self):
+        "wait for everything queued so far to hit the disk"
+        if self.__pool:
+            while self.__pending:
+                self.__collect()
+        elif self.__threads:
+            self.__queue.join()
+        self.__check()
+
+    def close(self):
+        self.flush()
+        if self.__pool:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def summary(self):
+        if not self.latencies:
+            return "wrote 0 frames"
+        latencies = sorted(self.latencies)
+        return "wrote %d frames, latency mean %.1fms p95 %.1fms max %.1fms, " \
+                "queue depth mean %.1f max %d" % (len(latencies), \
+                1000 * sum(latencies) / len(latencies), \
+                1000 * latencies[int(math.ceil(0.95 * len(latencies))) - 1], \
+                1000 * latencies[-1], \
+                float(sum(self.depths)) / max(1, len(self.depths)), \
+                max(self.depths or [0]))
+
+
+class FrameSink(object):
+    """
+    Where finished frames go, override write
+    AnimationMaker calls open, write for each frame in order, then close
+    shardable sinks can be opened in several processes at once,
+    each writing its own frames
+    """
+    shardable = False
+
+    def open(self, maker):
+        pass
+
+    def position(self):
+        "what resume needs to carry on from here, saved in checkpoints"
+        return None
+
+    def resume(self, maker, position):
+        "open again to carry on from a position"
+        self.open(maker)
+
+    def write(self, frameNum, img):
+        pass
+
+    def repeat(self, frameNum, img):
+        "frameNum is the same image as the frame written just before it"
+        self.write(frameNum, img)
+
+    def writeStored(self, frameNum, stored):
+        "frameNum is already saved in a file, stored is a StoredFrame"
+        self.write(frameNum, stored.image())
+
+    def flush(self):
+        "everything written so far is out"
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink(FrameSink):
+    "one image file per frame, dest % frameNum, saved by a FrameWriter"
+    shardable = True
+
+    def __init__(self, dest, format="PNG", options=None, writers=1, \
+                    queue_size=8, processes=False, verbose=True):
+        self.dest = dest
+        self.format = format
+        self.options = options or {}
+        self.writers = writers
+        self.queueSize = queue_size
+        self.processes = processes
+        self.verbose = verbose
+        self.writer = None
+        self.__last = None
+        self.__copies = []
+
+    def open(self, maker):
+        self.writer = FrameWriter(self.writers, self.queueSize, self.format, \
+                        self.options, self.processes)
+        self.__last = None
+
+    def write(self, frameNum, img):
+        frameFilename = self.dest % frameNum
+        if self.verbose:
+            print "write " + frameFilename
+        self.writer.write(frameFilename, img)
+        self.__last = frameFilename
+
+    def repeat(self, frameNum, img):
+        "copy the file once it's saved rather than encode it again"
+        if self.__last is None:
+            return self.write(frameNum, img)
+        frameFilename = self.dest % frameNum
+        if self.verbose:
+            print "copy " + frameFilename
+        self.__copies.append((self.__last, frameFilename))
+
+    def writeStored(self, frameNum, stored):
+        "copy the file when it's in our format"
+        if stored.format != self.format:
+            return self.write(frameNum, stored.image())
+        frameFilename = self.dest % frameNum
+        if self.verbose:
+            print "cached " + frameFilename
+        shutil.copyfile(stored.path, frameFilename)
+        self.__last = frameFilename
+
+    def flush(self):
+        self.writer.flush()
+        for src, dst in self.__copies:
+            shutil.copyfile(src, dst)
+        self.__copies = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if self.verbose:
+            sys.stderr.write(self.writer.summary() + "\n")
+        self.writer = None
+
+
+class StreamSink(FrameSink):
+    """
+    Frames back to back in one file, or on stdout when dest is "-"
+    so they can be piped straight into an encoder
+    while streaming to stdout, prints go to stderr
+    """
+
+    def __init__(self, dest="-"):
+        self.dest = dest
+        self.stream = None
+        self.frames = 0
+        self.verbose = True
+        self.__stdout = None
+        self.__last = None
+
+    def open(self, maker):
+        self.size = maker.size
+        self.verbose = maker.verbose
+        self.frames = 0
+        if self.dest == "-":
+            self.__stdout = sys.stdout
+            self.stream = sys.stdout
+            sys.stdout = sys.stderr
+        else:
+            self.stream = open(self.dest, "wb")
+        self.stream.write(self.header())
+
+    def position(self):
+        "(offset, frames), a pipe has no offset, it can't be resumed anyway"
+        self.stream.flush()
+        if self.dest == "-":
+            return (None, self.frames)
+        return (self.stream.tell(), self.frames)
+
+    def resume(self, maker, position):
+        "cut the file back to position and append from there"
+        if self.dest == "-":
+            raise ValueError("can't resume a stream on stdout")
+        self.size = maker.size
+        self.verbose = maker.verbose
+        offset, self.frames = position
+        self.stream = open(self.dest, "r+b")
+        self.stream.truncate(offset)
+        self.stream.seek(offset)
+
+    def header(self):
+        return ""
+
+    def frameData(self, img):
+        "the bytes for one frame, rgb24, override me for other formats"
+        return img.tostring()
+
+    def write(self, frameNum, img):
+        if img.size != self.size:
+            raise ValueError("frame %d is %dx%d, stream is %dx%d" % \
+                    ((frameNum,) + img.size + self.size))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        self.__last = self.frameData(img)
+        self.stream.write(self.__last)
+        self.frames += 1
+
+    def repeat(self, frameNum, img):
+        "the last frame's bytes again"
+        self.stream.write(self.__last)
+        self.frames += 1
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+        if self.__stdout is not None:
+            sys.stdout = self.__stdout
+            self.__stdout = None
+        else:
+            self.stream.close()
+        self.stream = None
+        if self.verbose:
+            sys.stderr.write("streamed %d frames to %s\n" % (self.frames, self.dest))
+
+
+class RawSink(StreamSink):
+    """
+    headerless rgb24, eg
+    ... | ffmpeg -f rawvideo -pix_fmt rgb24 -s 720x480 -r 25 -i - out.mp4
+    it's StreamSink as it is, no header and frameData's rgb24
+    """
+
+
+class Y4MSink(StreamSink):
+    """
+    YUV4MPEG2, full range 4:4:4, eg
+    ... | ffmpeg -i - out.mp4
+    """
+
+    def __init__(self, dest="-", fps=(25, 1)):
+        StreamSink.__init__(self, dest)
+        self.fps = fps
+
+    def header(self):
+        return "YUV4MPEG2 W%d H%d F%d:%d Ip A1:1 C444 XCOLORRANGE=FULL\n" % \
+                (self.size + tuple(self.fps))
+
+    def frameData(self, img):
+        planes = img.convert("YCbCr").split()
+        return "FRAME\n" + "".join([plane.tostring() for plane in planes])
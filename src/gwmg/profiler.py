@@ -0,0 +1,199 @@
+# gwmg.profiler.py
+
+"""
+Where a render's time goes: every effect update (labelled with its
+act, class, attach order and range), the provider reads inside it, and
+the writes to the sink, each with calls, wall time and the bytes of
+image an effect allocated (copies, and new images it left in its keeper)
+start() turns it on for this process, stop() turns it off again
+while current is None the hooks in base cost an attribute lookup
+"""
+
+import time
+import json
+import base
+
+# the running Profiler, None when profiling is off
+current = None
+
+
+def start():
+    global current
+    current = Profiler()
+    return current
+
+
+def stop():
+    "turn profiling off, returns what it collected"
+    global current
+    profile, current = current, None
+    return profile
+
+
+def effectName(control, observer):
+    "class#attach order first-last, the act comes from control.acts"
+    act, index = control.acts.get(id(observer), ("-", "?"))
+    frame_range = getattr(observer, "frameRange", ("?", "?"))
+    return act, "%s#%s %s-%s" % (observer.__class__.__name__, index, \
+                                    frame_range[0], frame_range[1])
+
+
+def imageSize(img):
+    if img is None:
+        return 0
+    if hasattr(img, "nbytes"):
+        return img.nbytes
+    return base.imageBytes(img)
+
+
+def held(control, nodes):
+    "the images the keepers (or control) in nodes hold"
+    images = []
+    for node in nodes:
+        if node is control or isinstance(node, base.Controller):
+            images.append(control.frame)
+        elif hasattr(node, "peekImage"):
+            images.append(node.peekImage())
+    return images
+
+
+def written(control, observer):
+    "what observer's outputs hold, to see what an update made"
+    if not hasattr(observer, "writes"):
+        return []
+    return held(control, observer.writes(control))
+
+
+class Profiler(object):
+    """
+    totals are by stack, a tuple of names from the root down, eg
+    ("render", "act2", "Mask#12 3501-5500", "MaskProvider fountain%04d.png")
+    each is [calls, seconds, self seconds, bytes]
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.__stack = []
+
+    def enter(self, name):
+        self.__stack.append([name, time.time(), 0.0])
+
+    def leave(self, nbytes=0):
+        name, started, children = self.__stack.pop()
+        elapsed = time.time() - started
+        stack = tuple([entry[0] for entry in self.__stack]) + (name,)
+        total = self.totals.get(stack)
+        if total is None:
+            total = self.totals[stack] = [0, 0.0, 0.0, 0]
+        total[0] += 1
+        total[1] += elapsed
+        total[2] += elapsed - children
+        total[3] += nbytes
+        if self.__stack:
+            self.__stack[-1][2] += elapsed
+
+    def call(self, name, function, *args):
+        "function(*args), timed under name"
+        self.enter(name)
+        try:
+            return function(*args)
+        finally:
+            self.leave()
+
+    def update(self, control, observer):
+        "observer.update(control), timed under its act and name"
+        act, name = effectName(control, observer)
+        # images already about, so not made by this update
+        before = written(control, observer) + \
+                    held(control, getattr(observer, "reads", list)())
+        copied = base.copies.bytes
+        self.enter(act)
+        self.enter(name)
+        try:
+            if control.blockSize > 1 and control.backend.blocks:
+                control.fillBlock(observer)
+            observer.update(control)
+        finally:
+            made = [img for img in written(control, observer) \
+                    if not [old for old in before if old is img]]
+            self.leave(base.copies.bytes - copied + sum([imageSize(img) for img in made]))
+            self.leave()
+
+    def merge(self, totals):
+        "add in totals from another Profiler, eg a shard's"
+        for stack, (calls, seconds, own, nbytes) in totals.items():
+            total = self.totals.get(stack)
+            if total is None:
+                total = self.totals[stack] = [0, 0.0, 0.0, 0]
+            total[0] += calls
+            total[1] += seconds
+            total[2] += own
+            total[3] += nbytes
+
+    def rows(self):
+        "(stack, calls, seconds, self seconds, bytes), slowest first"
+        rows = [(stack,) + tuple(total) for stack, total in self.totals.items()]
+        rows.sort(key=lambda row: -row[2])
+        return rows
+
+    def summary(self, top=10):
+        "a table per act of its slowest effects, and the writes"
+        acts = {}
+        for stack, calls, seconds, own, nbytes in self.rows():
+            if stack[0] == "render" and len(stack) == 2:
+                acts[stack[1]] = seconds
+        lines = []
+        line = "%-36s %8s %10s %10s %9s %9s"
+        for act in sorted(acts, key=lambda act: -acts[act]):
+            lines.append("%s %.2fs" % (act, acts[act]))
+            lines.append(line % ("  effect", "calls", "total ms", "self ms", \
+                                    "ms/call", "MB"))
+            effects = [row for row in self.rows() \
+                        if len(row[0]) == 3 and row[0][:2] == ("render", act)]
+            for stack, calls, seconds, own, nbytes in effects[:top]:
+                lines.append(line % ("  " + stack[2][:34], calls, \
+                        "%.1f" % (1000 * seconds), "%.1f" % (1000 * own), \
+                        "%.2f" % (1000 * seconds / calls), "%.1f" % (nbytes / 1048576.0)))
+        for stack, calls, seconds, own, nbytes in self.rows():
+            if stack[0] == "write" and len(stack) == 1:
+                lines.append("write %.2fs, %d frames, %.2fms a frame" % \
+                        (seconds, calls, 1000 * seconds / calls))
+        return "\n".join(lines)
+
+    def dumpJSON(self, path):
+        out = open(path, "w")
+        try:
+            json.dump([{"stack": list(stack), "calls": calls, "seconds": seconds, \
+                        "self": own, "bytes": nbytes} \
+                        for stack, calls, seconds, own, nbytes in self.rows()], \
+                        out, indent=1)
+        finally:
+            out.close()
+
+    def dumpCSV(self, path):
+        out = open(path, "w")
+        try:
+            out.write("stack,calls,seconds,self,bytes\n")
+            for stack, calls, seconds, own, nbytes in self.rows():
+                out.write('"%s",%d,%.6f,%.6f,%d\n' % (";".join(stack).replace('"', '""'), \
+                            calls, seconds, own, nbytes))
+        finally:
+            out.close()
+
+    def dumpFolded(self, path):
+        "collapsed stacks for flamegraph.pl and friends, self time in microseconds"
+        out = open(path, "w")
+        try:
+            for stack, calls, seconds, own, nbytes in self.rows():
+                micros = int(own * 1000000)
+                if micros > 0:
+                    out.write("%s %d\n" % (";".join([name.replace(";", ",") \
+                                for name in stack]), micros))
+        finally:
+            out.close()
+
+    def dump(self, prefix):
+        "prefix.json, prefix.csv and prefix.folded"
+        self.dumpJSON(prefix + ".json")
+        self.dumpCSV(prefix + ".csv")
+        self.dumpFolded(prefix + ".folded")
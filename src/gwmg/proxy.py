@@ -0,0 +1,178 @@
+# gwmg.proxy.py
+
+"""
+Proxies are source sequences decoded and fitted once, ahead of time
+a proxy file is a text header padded to HEADER_SIZE, then every frame's
+raw pixels back to back, and it's read through mmap so a frame costs
+no decoding and next to no copying
+RGB is kept padded to RGBX, PIL maps RGBX (and L) but copies RGB, so
+frames come out RGBX and are converted where something needs RGB, with
+numpy they're read as arrays over the map, see getArray
+the header keeps a signature of the source files, a proxy whose
+sources have changed since is stale and isn't used
+"""
+
+import os
+import sys
+import md5
+import mmap
+import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = "GWMGPROXY"
+VERSION = 2
+HEADER_SIZE = 4096
+
+
+def storedMode(mode):
+    "how a mode's pixels are kept, 1 bit masks as 0/255 bytes, RGB as RGBX"
+    if mode == "1":
+        return "L"
+    if mode == "RGB":
+        return "RGBX"
+    return mode
+
+
+def signature(paths):
+    "changes when any of the source files does, by size and mtime"
+    digest = md5.new(str(VERSION))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update("%s %d %d\n" % (path, stat.st_size, int(stat.st_mtime * 1000)))
+    return digest.hexdigest()
+
+
+def proxyPath(directory, provider):
+    return os.path.join(directory, "%s-%s.proxy" % \
+            (provider.__class__.__name__, md5.new(provider.proxyKey()).hexdigest()))
+
+
+class Proxy(object):
+    "an ingested sequence, mapped, don't close it while its frames are about"
+
+    def __init__(self, path):
+        self.path = path
+        self.__file = open(path, "rb")
+        header = self.__file.read(HEADER_SIZE).rstrip("\0").split()
+        if len(header) != 7 or header[0] != MAGIC or header[1] != str(VERSION):
+            self.__file.close()
+            raise ValueError("%s isn't a proxy" % path)
+        self.mode = header[2]
+        self.rawMode = storedMode(self.mode)
+        self.size = (int(header[3]), int(header[4]))
+        self.length = int(header[5])
+        self.signature = header[6]
+        self.frameBytes = self.size[0] * self.size[1] * Image.getmodebands(self.rawMode)
+        # RGBX frames as arrays, an image of them would be a copy anyway
+        self.arrays = numpy is not None and self.rawMode == "RGBX"
+        if os.fstat(self.__file.fileno()).st_size < \
+                HEADER_SIZE + self.length * self.frameBytes:
+            self.__file.close()
+            raise ValueError("%s is cut short" % path)
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def frameBuffer(self, index):
+        return buffer(self.__map, HEADER_SIZE + index * self.frameBytes, self.frameBytes)
+
+    def getFrame(self, index):
+        """
+        frame index, from 0, mapped, RGB sequences' frames come out RGBX,
+        only 1 bit masks are converted (copied) back
+        """
+        img = Image.frombuffer(self.rawMode, self.size, self.frameBuffer(index), \
+                "raw", self.rawMode, 0, 1)
+        if self.mode == "1":
+            img = img.convert(self.mode)
+        return img
+
+    def getArray(self, index):
+        "frame index as a read only RGB array over the map, if arrays"
+        width, height = self.size
+        array = numpy.frombuffer(self.frameBuffer(index), numpy.uint8)
+        return array.reshape((height, width, 4))[:, :, :3]
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+
+def ingest(provider, directory, verbose=True):
+    """
+    decode provider's sequence the way it would and write its proxy to
+    directory, returns the path or None if there are no frames
+    """
+    paths = provider.framePaths()
+    if not paths:
+        return None
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = proxyPath(directory, provider)
+    out = open(path + ".part", "wb")
+    try:
+        out.write("\0" * HEADER_SIZE)
+        mode = None
+        for frame_num in range(1, len(paths) + 1):
+            img = provider.decode(frame_num)
+            if mode is None:
+                mode = img.mode
+            elif img.mode != mode:
+                raise ValueError("%s is %s, the frames before it were %s" % \
+                        (paths[frame_num - 1], img.mode, mode))
+            if img.size != tuple(provider.size):
+                raise ValueError("%s came out %dx%d" % ((paths[frame_num - 1],) + img.size))
+            if storedMode(mode) != mode:
+                img = img.convert(storedMode(mode))
+            out.write(img.tostring())
+        header = "%s %d %s %d %d %d %s\n" % ((MAGIC, VERSION, mode) + \
+                    tuple(provider.size) + (len(paths), signature(paths)))
+        out.seek(0)
+        out.write(header.ljust(HEADER_SIZE, "\0"))
+    finally:
+        out.close()
+    os.rename(path + ".part", path)
+    if verbose:
+        print "ingested %d frames to %s" % (len(paths), path)
+    return path
+
+
+def isCurrent(provider, directory):
+    "provider has a proxy in directory and its sources haven't changed"
+    proxy = load(provider, directory, False)
+    if proxy is None:
+        return False
+    proxy.close()
+    return True
+
+
+def load(provider, directory, verbose=True):
+    "provider's proxy from directory, None if there isn't a good one"
+    path = proxyPath(directory, provider)
+    if not os.path.exists(path):
+        return None
+    try:
+        proxy = Proxy(path)
+    except (IOError, ValueError), e:
+        if verbose:
+            sys.stderr.write("ignoring proxy: %s\n" % e)
+        return None
+    paths = provider.framePaths()
+    if proxy.length != len(paths) or proxy.size != tuple(provider.size) or \
+            proxy.signature != signature(paths):
+        if verbose:
+            sys.stderr.write("proxy %s is stale, run ingest again\n" % path)
+        proxy.close()
+        return None
+    return proxy
+
+
+def useProxies(directory, providers):
+    """
+    point providers at their proxies in directory, where they're good,
+    they load them on their first read
+    """
+    for provider in providers:
+        provider.useProxy(directory)
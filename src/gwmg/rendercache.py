@@ -0,0 +1,181 @@
+# gwmg.rendercache.py
+
+import os
+import glob
+import md5
+import Image
+import base
+import output
+
+
+def codeSalt():
+    "changes whenever the gwmg code does"
+    digest = md5.new()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))):
+        digest.update(open(path, "rb").read())
+    return digest.hexdigest()
+
+
+class Fingerprinter(object):
+    """
+    Walks the frames symbolically, no pixels, working out a fingerprint
+    for every value each effect writes: its settings, its frame, and the
+    fingerprints of what it reads, down to source file contents
+    a frame's fingerprint is that of control.frame once it's done
+    """
+
+    def __init__(self, control, size, salt=None):
+        self.control = control
+        self.size = size
+        self.salt = salt or codeSalt()
+        self.values = {} # id(keeper or control) -> (fingerprint, frame written)
+
+    def node(self, provider):
+        "the keeper or controller behind a provider, None for a plain one"
+        return base.imageNode(self.control, provider)
+
+    def value(self, node):
+        return self.values.get(id(node), ("unset", None))
+
+    def frame(self, frame_num):
+        """
+        step through frame_num, returns (fingerprint, carried) where carried
+        lists (node, frame) for values read here that an earlier frame wrote
+        """
+        carried = []
+        for effect in self.control.activeAt(frame_num):
+            if not hasattr(effect, "reads") or not effect.changesAt(frame_num):
+                continue
+            frame = effect.localFrame(frame_num)
+            inputs = []
+            for provider in effect.reads():
+                node = self.node(provider)
+                if node is None:
+                    inputs.extend([provider.fingerprint(f) for f in effect.readFrames(frame)])
+                    continue
+                fingerprint, written = self.value(node)
+                if written is not None and written < frame_num:
+                    carried.append((node, written))
+                mode = getattr(provider, "readMode", lambda: None)()
+                inputs.append("%s %s" % (fingerprint, mode))
+            fingerprint = md5.new("\n".join([effect.describe(), str(frame)] + \
+                                    inputs)).hexdigest()
+            for node in effect.writes(self.control):
+                self.values[id(node)] = (fingerprint, frame_num)
+        # the frame itself is whatever control.frame was left at
+        written = self.value(self.control)[1]
+        if written is not None and written < frame_num:
+            carried.append((self.control, written))
+        out = md5.new("%s %s %s %s" % (self.salt, self.size, self.control.backend.name, \
+                        self.value(self.control)[0])).hexdigest()
+        return out, carried
+
+
+class Plan(object):
+    "what make does about each frame when it can use the cache"
+
+    def __init__(self):
+        self.fingerprints = {}
+        self.render = set()   # frames to render
+        self.restore = {}     # frame -> earlier frame whose output is control.frame
+
+
+class RenderCache(object):
+    """
+    Frames saved under directory by fingerprint, so a re-render only
+    renders frames whose fingerprint is new, eg the ones an edit touched
+    """
+
+    def __init__(self, directory, format="PNG", options=None):
+        self.directory = directory
+        self.format = format
+        self.options = options or {}
+        self.hits = 0
+        self.misses = 0
+        self.__writer = None
+
+    def path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint[:2], \
+                            "%s.%s" % (fingerprint, self.format.lower()))
+
+    def has(self, fingerprint):
+        return os.path.exists(self.path(fingerprint))
+
+    def load(self, fingerprint):
+        img = Image.open(self.path(fingerprint))
+        img.load()
+        return img
+
+    def stored(self, fingerprint):
+        return output.StoredFrame(self.path(fingerprint), self.format)
+
+    def store(self, fingerprint, img):
+        "save img in the background, it shows up once it's complete"
+        path = self.path(fingerprint)
+        if os.path.exists(path):
+            return
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        if self.__writer is None:
+            self.__writer = output.FrameWriter(1, 8, self.format, self.options, \
+                                atomic=True)
+        self.__writer.write(path, img)
+
+    def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+    def summary(self):
+        return "render cache %s: %d hits, %d rendered" % \
+                (self.directory, self.hits, self.misses)
+
+    def frames(self, maker, control, warm_up, first, last):
+        "render what the plan says, yields (frameNum, img or StoredFrame)"
+        plan = self.plan(control, maker.size, warm_up, first, last)
+        stored = None
+        for frame_num in range(warm_up, last + 1):
+            fingerprint = plan.fingerprints[frame_num]
+            if frame_num in plan.render:
+                if frame_num in plan.restore:
+                    control.frame = self.load(plan.fingerprints[plan.restore[frame_num]])
+                control.seek(frame_num)
+                control.notify()
+                if frame_num < first:
+                    continue
+                self.misses += 1
+                if control.frame:
+                    self.store(fingerprint, control.frame)
+                yield frame_num, control.frame
+            elif frame_num >= first:
+                self.hits += 1
+                if stored is None or stored.path != self.path(fingerprint):
+                    stored = self.stored(fingerprint)
+                yield frame_num, stored
+
+    def plan(self, control, size, warm_up, first, last):
+        """
+        fingerprint warm_up to last and decide what to render
+        a frame renders on a miss, and so does any earlier frame whose
+        keepers it reads; control.frame can come back out of the cache
+        """
+        plan = Plan()
+        fingerprinter = Fingerprinter(control, size)
+        carried = {}
+        for frame_num in range(warm_up, last + 1):
+            plan.fingerprints[frame_num], carried[frame_num] = \
+                    fingerprinter.frame(frame_num)
+            if frame_num >= first and not self.has(plan.fingerprints[frame_num]):
+                plan.render.add(frame_num)
+        for frame_num in range(last, warm_up - 1, -1):
+            if frame_num not in plan.render:
+                continue
+            for node, written in carried[frame_num]:
+                if written < warm_up:
+                    continue
+                if node is control and written not in plan.render and \
+                        self.has(plan.fingerprints[written]):
+                    plan.restore[frame_num] = written
+                else:
+                    plan.render.add(written)
+        return plan
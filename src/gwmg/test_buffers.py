@@ -0,0 +1,65 @@
+# gwmg.test_buffers.py
+
+"""
+The buffer pool gets its images back: the ones handed out over a render
+that are still out at the end are the few the keepers and control hold,
+however many frames it was, fits and masks cached from them or not
+run from the src directory:
+    python -m unittest discover
+"""
+
+import gc
+import shutil
+import tempfile
+import unittest
+import base
+import bench
+from test_timeline import Movie
+
+
+class BufferPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sequence, image = bench.sources(self.directory, 12)
+        self.maker = Movie((1, 60), sequence, image)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def render(self):
+        "every frame, returns how many buffers were out after each"
+        out = []
+        for frame_num, img in self.maker.frames(1, 60):
+            out.append(base.buffers.outstanding())
+        # a finished control is a cycle (keepers and effects), collect it
+        # and take back what it had out
+        gc.collect()
+        base.buffers.endFrame()
+        return out
+
+    def testOutstandingStaysBounded(self):
+        self.render()
+        before = base.buffers.outstanding()
+        out = []
+        for n in range(3):
+            out.extend(self.render())
+            self.assertEqual(base.buffers.outstanding(), before)
+        # a frame holds a handful, not one per frame rendered
+        self.assertTrue(max(out) <= before + 4, "out went up to %d" % max(out))
+
+    def testSweptFitsLetBuffersGo(self):
+        "a fit cached from a pooled buffer doesn't keep it out"
+        # whatever earlier tests left out goes back first
+        gc.collect()
+        base.buffers.endFrame()
+        img = base.buffers.blank("RGB", (40, 30))
+        base.fit(img, (20, 20))
+        before = base.buffers.outstanding()
+        del img
+        base.buffers.endFrame()
+        self.assertEqual(base.buffers.outstanding(), before - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
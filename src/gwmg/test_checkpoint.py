@@ -0,0 +1,92 @@
+# gwmg.test_checkpoint.py
+
+"""
+A render that dies partway and is resumed from its last checkpoint has
+to leave the same output, byte for byte, as one that ran straight
+through, for a stream (Y4M) and for files (FileSink)
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+import bench
+import output
+from test_timeline import Movie
+
+EVERY = 10
+CRASH_AT = 37
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingY4MSink(output.Y4MSink):
+    "dies on frame CRASH_AT, like a render killed partway"
+
+    def write(self, frameNum, img):
+        if frameNum == CRASH_AT:
+            raise Crash()
+        output.Y4MSink.write(self, frameNum, img)
+
+
+class CrashingFileSink(output.FileSink):
+
+    def write(self, frameNum, img):
+        if frameNum == CRASH_AT:
+            raise Crash()
+        output.FileSink.write(self, frameNum, img)
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sequence, self.image = bench.sources(self.directory, 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def maker(self, sink):
+        maker = Movie((1, 60), self.sequence, self.image)
+        maker.sink = sink
+        return maker
+
+    def interrupted(self, crashing, sink):
+        "render into crashing till it dies, then resume into sink"
+        checkpoints = os.path.join(self.directory, "checkpoints")
+        self.assertRaises(Crash, self.maker(crashing).make, \
+                            checkpoint_dir=checkpoints, checkpoint_every=EVERY)
+        self.assertTrue(glob.glob(os.path.join(checkpoints, "checkpoint-*.pkl")))
+        self.maker(sink).resume(checkpoints, EVERY)
+
+    def testStream(self):
+        straight = os.path.join(self.directory, "straight.y4m")
+        self.maker(output.Y4MSink(straight)).make()
+        resumed = os.path.join(self.directory, "resumed.y4m")
+        self.interrupted(CrashingY4MSink(resumed), output.Y4MSink(resumed))
+        want = open(straight, "rb").read()
+        self.assertEqual(want.count("FRAME\n"), 60)
+        self.assertTrue(open(resumed, "rb").read() == want, "resumed stream differs")
+
+    def testFiles(self):
+        os.mkdir(os.path.join(self.directory, "straight"))
+        os.mkdir(os.path.join(self.directory, "resumed"))
+        straight = os.path.join(self.directory, "straight", "frame%04d.png")
+        self.maker(output.FileSink(straight, verbose=False)).make()
+        resumed = os.path.join(self.directory, "resumed", "frame%04d.png")
+        self.interrupted(CrashingFileSink(resumed, verbose=False), \
+                            output.FileSink(resumed, verbose=False))
+        for frame_num in range(1, 61):
+            want = open(straight % frame_num, "rb").read()
+            got = open(resumed % frame_num, "rb").read()
+            self.assertTrue(got == want, "frame %d differs" % frame_num)
+        self.assertEqual(len(os.listdir(os.path.dirname(resumed))), 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# gwmg.test_curves.py
+
+"""
+Easings, Curves and Tracks: the values at frames, on and off the
+table, whole ranges at once, and the tweens TweenFactory makes of them
+run from the src directory:
+    python -m unittest discover
+"""
+
+import unittest
+import base
+import curves
+
+
+def listed(values):
+    "values(frames) as a plain list, it's an array with numpy"
+    return [float(value) for value in values]
+
+
+class EasingTest(unittest.TestCase):
+
+    def testEnds(self):
+        for name, ease in curves.EASINGS.items():
+            self.assertEqual((ease(0.0), ease(1.0)), (0.0, 1.0), name)
+
+    def testRising(self):
+        steps = [n / 20.0 for n in range(21)]
+        for name, ease in curves.EASINGS.items():
+            values = [ease(t) for t in steps]
+            self.assertEqual(values, sorted(values), name)
+
+    def testShapes(self):
+        self.assertTrue(curves.easeIn(0.25) < 0.25 < curves.easeOut(0.25))
+        self.assertEqual(curves.easeInOut(0.5), 0.5)
+
+
+class CurveTest(unittest.TestCase):
+
+    def testLinear(self):
+        curve = curves.Curve(100, 8)
+        self.assertEqual(curve.getStep(), 12.5)
+        self.assertEqual(curve.getStep(3), 12.5)
+        for frame in range(12):
+            self.assertEqual(curve.getValue(frame), 12.5 * frame)
+
+    def testLinearGoesOn(self):
+        # past number_of_steps, and between frames, like LinearTween
+        curve = curves.Curve(10, 4)
+        self.assertEqual(curve.getValue(6), 15.0)
+        self.assertEqual(curve.getValue(2.5), 6.25)
+
+    def testNearTheSum(self):
+        "step * frame is within rounding of the step added up frame by frame"
+        curve = curves.Curve(1.0, 30)
+        total = 0.0
+        for frame in range(1, 31):
+            total += curve.getStep(frame)
+            self.assertAlmostEqual(curve.getValue(frame), total, 12)
+
+    def testEased(self):
+        for easing in ("easeIn", "easeOut", "easeInOut"):
+            curve = curves.Curve(50, 10, easing)
+            self.assertEqual(curve.getValue(0), 0.0)
+            self.assertEqual(curve.getValue(10), 50.0)
+            # they stop at total_change
+            self.assertEqual(curve.getValue(14), 50.0)
+            self.assertAlmostEqual(sum([curve.getStep(f) for f in range(1, 11)]), 50.0)
+            self.assertAlmostEqual(curve.getValue(4), 50 * curves.EASINGS[easing](0.4))
+
+    def testNothing(self):
+        for curve in (curves.Curve(0, 10), curves.Curve(5, 0), curves.Curve(0, 0, "easeIn")):
+            self.assertEqual(curve.getStep(), 0)
+            self.assertEqual(listed(curve.values(range(5))), [0.0] * 5)
+
+    def testValues(self):
+        for easing in curves.EASINGS:
+            curve = curves.Curve(30, 12, easing)
+            frames = [0, 3, 12, 15, 7.5, -1]
+            self.assertEqual(listed(curve.values(frames)), \
+                                [curve.getValue(f) for f in frames])
+        self.assertEqual(listed(curves.Curve(1, 1).values([])), [])
+
+
+class TrackTest(unittest.TestCase):
+
+    def setUp(self):
+        # out of order on purpose, and an easing on the way back
+        self.track = curves.Track([(20, 0, "easeOut"), (0, 0), (10, 100)])
+
+    def testKeyframes(self):
+        for frame, value in ((0, 0), (10, 100), (20, 0)):
+            self.assertEqual(self.track.getValue(frame), value)
+
+    def testHolds(self):
+        self.assertEqual(self.track.getValue(-5), 0.0)
+        self.assertEqual(self.track.getValue(40), 0.0)
+        self.assertEqual(curves.Track([(5, 3)]).getValue(0), 3.0)
+
+    def testBetween(self):
+        self.assertEqual(self.track.getValue(5), 50.0)
+        self.assertAlmostEqual(self.track.getValue(15), 100 - 100 * curves.easeOut(0.5))
+        self.assertEqual(self.track.getStep(5), 10.0)
+        self.assertEqual(self.track.getStep(), 0)
+
+    def testValues(self):
+        frames = range(-2, 25) + [12.5]
+        self.assertEqual(listed(self.track.values(frames)), \
+                            [self.track.getValue(f) for f in frames])
+
+    def testEmpty(self):
+        self.assertRaises(ValueError, curves.Track, [])
+
+    def testScaled(self):
+        scaled = curves.Track([(0, 0), (0.5, 1, "easeIn"), (1, 0)]).scaled(255, 40)
+        self.assertEqual(scaled.keyframes, \
+                [(0, 0, "linear"), (20.0, 255, "easeIn"), (40, 0, "linear")])
+        self.assertEqual(scaled.getValue(20), 255.0)
+
+
+class TweenFactoryTest(unittest.TestCase):
+
+    def testMakers(self):
+        factory = base.TweenFactory()
+        self.assertTrue(isinstance(factory.linear(10, 5), base.LinearTween))
+        self.assertEqual(factory.linear(10, 5).getValue(3), 6.0)
+        self.assertEqual(factory.easeInOut(10, 4).getValue(2), 5.0)
+        there_and_back = factory.track([(0, 0), (0.5, 1), (1, 0)])
+        tween = there_and_back(1.0, 10)
+        self.assertEqual(listed(tween.values([0, 5, 10])), [0.0, 1.0, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# gwmg.test_effects.py
+
+"""
+A blockable effect without a blockImages of its own gets one that runs
+update frame by frame: the frames come out as they do without blocks,
+and the keeper and controller are left as they were
+run from the src directory:
+    python -m unittest discover
+"""
+
+import shutil
+import tempfile
+import unittest
+import backends
+import base
+import bench
+import Effects
+
+SIZE = (90, 60)
+
+
+class PlainScale(Effects.ColorScale):
+    "ColorScale working out its blocks the default way"
+    blockImages = Effects.Effect.blockImages.im_func
+
+
+class BlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sequence, image = bench.sources(self.directory, 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def render(self, block_size):
+        control = base.Controller((1, 21), "numpy", block_size)
+        keeper = base.ImageKeeper(SIZE)
+        self.scale = PlainScale((1, 21), keeper, \
+                    (base.FrameProvider(SIZE, self.sequence),), "White", "Red")
+        control.attach(self.scale)
+        control.attach(Effects.Commit((1, 21), keeper))
+        frames = []
+        for frame_num in range(1, 21):
+            control.notify()
+            self.assertEqual(control.frameNum, frame_num)
+            frames.append(control.frame.tostring())
+        return frames
+
+    def testSameAsFrameByFrame(self):
+        if backends.numpy is None:
+            return
+        want = self.render(0)
+        self.assertEqual(self.render(8), want)
+
+    def testLeavesThingsBe(self):
+        if backends.numpy is None:
+            return
+        self.render(0)
+        control = base.Controller((1, 21), "numpy", 8)
+        control.frameNum = 5
+        self.scale.keeper.setImage("kept")
+        images = self.scale.blockImages(control, [6, 7, 8])
+        self.assertEqual(len(images), 3)
+        self.assertEqual((control.frameNum, self.scale.keeper.peekImage()), (5, "kept"))
+        self.assertEqual(self.scale.block, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# gwmg.test_jobs.py
+
+"""
+Rendering in shards over a process pool has to write what one process
+does: every shard is warmed up for its first frame, so jobs=3 gives the
+same stream, byte for byte, as jobs=1
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import bench
+import output
+from test_timeline import Movie
+
+
+class JobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sequence, self.image = bench.sources(self.directory, 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def rendered(self, jobs):
+        "the raw stream make(jobs) writes"
+        path = os.path.join(self.directory, "jobs%d.rgb" % jobs)
+        maker = Movie((1, 60), self.sequence, self.image)
+        maker.sink = output.RawSink(path)
+        maker.make(jobs)
+        return open(path, "rb").read()
+
+    def testSameBytes(self):
+        one = self.rendered(1)
+        # 60 frames, 90x60 rgb24
+        self.assertEqual(len(one), 60 * 90 * 60 * 3)
+        self.assertTrue(self.rendered(3) == one, "jobs=3 wrote other bytes")
+
+
+if __name__ == '__main__':
+    unittest.main()
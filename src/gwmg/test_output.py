@@ -0,0 +1,150 @@
+# gwmg.test_output.py
+
+"""
+The sinks: raw and Y4M streams have the header and frame sizes an
+encoder expects and nothing else on stdout, FileSink copies repeated
+and stored frames rather than encoding them again
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import Image
+import bench
+import output
+from test_timeline import Movie, SIZE
+
+W, H = SIZE
+FRAMES = 60
+Y4M_HEADER = "YUV4MPEG2 W90 H60 F25:1 Ip A1:1 C444 XCOLORRANGE=FULL\n"
+
+
+class Maker(object):
+    "what a sink needs of a maker"
+    size = SIZE
+    verbose = False
+
+
+def frame(color):
+    return Image.new("RGB", SIZE, color)
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sequence, self.image = bench.sources(self.directory, 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def streamed(self, sink, frames):
+        sink.open(Maker())
+        for frame_num, img in frames:
+            if img is None:
+                sink.repeat(frame_num, img)
+            else:
+                sink.write(frame_num, img)
+        sink.close()
+        return open(sink.dest, "rb").read()
+
+    def testRaw(self):
+        data = self.streamed(output.RawSink(self.path("out.rgb")), \
+                    [(1, frame("Red")), (2, frame("Blue")), (3, None)])
+        self.assertEqual(len(data), 3 * W * H * 3)
+        self.assertTrue(data[:3] == "\xff\0\0" and data[-3:] == "\0\0\xff")
+
+    def testDefaultIsRaw(self):
+        "a StreamSink that doesn't say otherwise streams rgb24"
+        frames = [(1, frame("Red")), (2, frame("Green"))]
+        self.assertEqual(self.streamed(output.StreamSink(self.path("out")), frames), \
+                    self.streamed(output.RawSink(self.path("out.rgb")), frames))
+
+    def testY4M(self):
+        data = self.streamed(output.Y4MSink(self.path("out.y4m")), \
+                    [(1, frame("White")), (2, frame("Black")), (3, None)])
+        self.assertTrue(data.startswith(Y4M_HEADER))
+        frame_bytes = len("FRAME\n") + W * H * 3
+        self.assertEqual(len(data), len(Y4M_HEADER) + 3 * frame_bytes)
+        frames = data[len(Y4M_HEADER):].split("FRAME\n")[1:]
+        self.assertEqual([len(f) for f in frames], [W * H * 3] * 3)
+        # full range, white is all 255 luma
+        self.assertEqual(frames[0][:W * H], "\xff" * W * H)
+        self.assertEqual(frames[2], frames[1])
+
+    def testStdoutIsOnlyTheStream(self):
+        "a verbose render streaming to stdout still puts nothing else there"
+        stdout, stderr = sys.stdout, sys.stderr
+        out = open(self.path("stdout"), "wb")
+        err = open(self.path("stderr"), "wb")
+        sys.stdout, sys.stderr = out, err
+        try:
+            maker = Movie((1, FRAMES), self.sequence, self.image)
+            maker.verbose = True
+            maker.sink = output.Y4MSink("-")
+            maker.make()
+            print "after the render"
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            out.close()
+            err.close()
+        data = open(self.path("stdout"), "rb").read()
+        self.assertTrue(data.startswith(Y4M_HEADER))
+        self.assertEqual(len(data), len(Y4M_HEADER) + FRAMES * (6 + W * H * 3) + \
+                            len("after the render\n"))
+        self.assertTrue("streamed %d frames" % FRAMES in open(self.path("stderr")).read())
+
+
+class FileSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dest = os.path.join(self.directory, "frame%04d.png")
+        self.sink = output.FileSink(self.dest, verbose=False)
+        self.sink.open(Maker())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def testRepeatIsACopy(self):
+        img = frame("Red")
+        self.sink.write(1, img)
+        self.sink.repeat(2, img)
+        self.sink.repeat(3, img)
+        self.sink.write(4, frame("Blue"))
+        writer = self.sink.writer
+        self.sink.close()
+        # two encoded, the repeats are copies
+        self.assertEqual(len(writer.latencies), 2)
+        first = open(self.dest % 1, "rb").read()
+        for frame_num in (2, 3):
+            self.assertEqual(open(self.dest % frame_num, "rb").read(), first)
+        self.assertEqual(Image.open(self.dest % 4).getpixel((0, 0)), (0, 0, 255))
+
+    def testRepeatFirst(self):
+        "nothing to copy yet, it's written"
+        self.sink.repeat(1, frame("Red"))
+        self.sink.close()
+        self.assertEqual(Image.open(self.dest % 1).getpixel((0, 0)), (255, 0, 0))
+
+    def testStored(self):
+        stored = os.path.join(self.directory, "stored.png")
+        frame("Green").save(stored)
+        self.sink.writeStored(1, output.StoredFrame(stored, "PNG"))
+        self.sink.writeStored(2, output.StoredFrame(stored, "JPEG"))
+        writer = self.sink.writer
+        self.sink.close()
+        self.assertEqual(open(self.dest % 1, "rb").read(), open(stored, "rb").read())
+        # the JPEG one isn't our format, it's encoded again
+        self.assertEqual(len(writer.latencies), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
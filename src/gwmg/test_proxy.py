@@ -0,0 +1,82 @@
+# gwmg.test_proxy.py
+
+"""
+A proxy gives back the frames its provider decodes, byte for byte:
+RGB sequences mapped as RGBX and converted for getImage, as arrays over
+the map for getPixels when there's numpy, masks in their own mode
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import base
+import bench
+import proxy
+
+SIZE = (90, 60)
+COUNT = 6
+
+
+class ProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.proxies = os.path.join(self.directory, "proxies")
+        self.sequence, image = bench.sources(self.directory, COUNT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def proxied(self, make):
+        "a provider made by make reading from its freshly ingested proxy"
+        self.assertTrue(proxy.ingest(make(), self.proxies, False))
+        provider = make()
+        provider.useProxy(self.proxies)
+        return provider
+
+    def testFramesReadBack(self):
+        make = lambda: base.FrameProvider(SIZE, self.sequence)
+        provider = self.proxied(make)
+        decoded = make()
+        for frame_num in range(1, COUNT + 2):
+            want = decoded.getImage(frame_num)
+            img = provider.getImage(frame_num)
+            self.assertEqual((img.mode, img.size), ("RGB", SIZE))
+            self.assertTrue(img.tostring() == want.tostring(), \
+                                "frame %d differs" % frame_num)
+        self.assertTrue(provider.proxy is not None)
+        self.assertEqual(provider.proxy.rawMode, "RGBX")
+
+    def testFramesAreMapped(self):
+        provider = self.proxied(lambda: base.FrameProvider(SIZE, self.sequence))
+        raw = provider.readImage(3)
+        self.assertEqual(raw.mode, "RGBX")
+        # frombuffer only marks what it mapped read only
+        self.assertTrue(raw.readonly)
+
+    def testArrays(self):
+        if proxy.numpy is None:
+            return
+        make = lambda: base.FrameProvider(SIZE, self.sequence)
+        provider = self.proxied(make)
+        array = provider.getPixels(4)
+        self.assertEqual(array.shape, (SIZE[1], SIZE[0], 3))
+        self.assertFalse(array.flags.owndata)
+        want = make().getImage(4)
+        self.assertTrue(array.tostring() == want.tostring())
+
+    def testMasks(self):
+        for type in ("1", "L"):
+            make = lambda: base.MaskProvider(SIZE, self.sequence, True, type)
+            provider = self.proxied(make)
+            want = make().getImage(2)
+            img = provider.getPixels(2)
+            self.assertEqual(img.mode, type)
+            self.assertTrue(img.tostring() == want.tostring(), "%s mask differs" % type)
+
+
+if __name__ == '__main__':
+    unittest.main()
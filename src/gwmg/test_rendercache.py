@@ -0,0 +1,69 @@
+# gwmg.test_rendercache.py
+
+"""
+The render cache: a re-render of an unchanged movie is all hits and
+comes out the same, after an edit the frames it touches (and what they
+carry into) are rendered again and the rest still come from the cache
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import bench
+import output
+import rendercache
+from test_timeline import Movie
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sequence, self.image = bench.sources(self.directory, 12)
+        self.cacheDirectory = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def render(self, cached=True):
+        "[(frameNum, rgb bytes)] and the cache, None for a plain render"
+        maker = Movie((1, 60), self.sequence, self.image)
+        cache = None
+        if cached:
+            cache = rendercache.RenderCache(self.cacheDirectory)
+        frames = []
+        try:
+            for frame_num, img in maker.frames(1, 60, cache=cache):
+                if isinstance(img, output.StoredFrame):
+                    img = img.image()
+                frames.append((frame_num, maker.frameImage(img).tostring()))
+        finally:
+            if cache:
+                cache.close()
+        return frames, cache
+
+    def testUnchanged(self):
+        first, cache = self.render()
+        self.assertEqual((cache.hits, cache.misses), (0, 60))
+        again, cache = self.render()
+        self.assertEqual((cache.hits, cache.misses), (60, 0))
+        self.assertTrue(again == first, "cached frames differ")
+
+    def testEdited(self):
+        self.render()
+        # the still is only read in act 1, the new one is a different size
+        # on disk, so its digest changes whatever the mtime does
+        bench.makeImage(bench.SOURCE_SIZE, 7).save(self.image)
+        edited, cache = self.render()
+        self.assertTrue(cache.misses > 0 and cache.hits > 0, \
+                            "%d hits, %d misses" % (cache.hits, cache.misses))
+        self.assertEqual(cache.hits + cache.misses, 60)
+        self.assertTrue(edited == self.render(False)[0], \
+                            "the edit wasn't rendered again")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# gwmg.test_timeline.py
+
+"""
+The timeline (with pruning and releasing) has to render what a plain
+loop over the same effects does: every observer, in attach order, that's
+inRange at the frame, from the first frame on
+it's the same effects both ways, so it checks the scheduling and the
+warm-up, not the effects against how they used to render
+run from the src directory:
+    python -m unittest discover
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import base
+import bench
+import Effects
+
+SIZE = (90, 60)
+
+
+class Movie(base.AnimationMaker):
+    "two acts over synthetic sources, most of the Effects, overlapping ranges"
+
+    def __init__(self, frame_range, sequence, image):
+        base.AnimationMaker.__init__(self, frame_range, None, SIZE, verbose=False)
+        self.sequence = sequence
+        self.image = image
+
+    def buildAnimation(self, control):
+        tween = base.TweenFactory().linear
+        frames = base.FrameProvider(SIZE, self.sequence)
+        # the same sequence, read at other frames, it has to loop the same
+        others = base.FrameProvider(SIZE, self.sequence)
+        mask = base.MaskProvider(SIZE, self.sequence, True)
+        still = base.ImageProvider(SIZE, self.image)
+        title = base.MaskImageProvider(SIZE, self.image, True)
+        white = base.ColorProvider(SIZE, "White")
+        red = base.ColorProvider(SIZE, "Red")
+        black_mask = base.ColorProvider(SIZE, "Black", "L")
+        keeper = base.ImageKeeper(SIZE)
+        control.attach(Effects.ColorScale((1, 30), keeper, (frames,), "White", "Red"))
+        control.attach(Effects.Mask((1, 30), keeper, (still, keeper, title)))
+        control.attach(Effects.SliceRepeaterPercentSlide((5, 30), keeper, \
+            (keeper,), (10, 40, 10, 10, 30), 8))
+        control.attach(Effects.SimpleFader((1, 10), keeper, (white, keeper), tween))
+        control.attach(Effects.Commit((1, 30), keeper))
+        keeper = base.ImageKeeper(SIZE)
+        mask_keeper = base.ImageKeeper(SIZE)
+        control.attach(Effects.SimpleFader((30, 60), keeper, (white, red), tween))
+        control.attach(Effects.FadeInOutPercent((30, 60), mask_keeper, \
+            (black_mask, mask), (20, 60, 20), tween))
+        control.attach(Effects.Mask((30, 60), keeper, (others, keeper, mask_keeper)))
+        control.attach(Effects.ColorSwapperGroup((\
+            Effects.ColorForColorPixelSwapper((30, 45), keeper, (keeper,), \
+                (255, 0, 0), (116, 125, 111), 30), \
+            Effects.ColorForColorPixelSwapper((40, 60), keeper, (keeper,), \
+                (255, 192, 203), (192, 125, 68), 17))))
+        control.attach(Effects.SliceRepeaterPercent((35, 55), keeper, \
+            (frames, keeper, mask_keeper.getMask(True, "1")), (50, 50), (False, True)))
+        control.attach(Effects.CollapsingSquares((50, 60), keeper, (keeper,), 5))
+        control.attach(Effects.SimpleFader((30, 40), keeper, (control, keeper), tween))
+        control.attach(Effects.Commit((30, 60), keeper))
+
+
+def naiveFrames(maker, first, last):
+    "(frameNum, frame) from a plain inRange loop, from the first frame of the movie"
+    control = maker.buildControl()
+    for frame_num in range(maker.frameRange[0], last + 1):
+        control.frameNum = frame_num
+        for observer in control._observers:
+            if observer.inRange(frame_num):
+                observer.update(control)
+        if frame_num >= first:
+            yield frame_num, control.frame
+
+
+class TimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sequence, image = bench.sources(self.directory, 12)
+        self.maker = Movie((1, 60), sequence, image)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def pixels(self, frames):
+        return [(frame_num, self.maker.frameImage(img).tostring()) \
+                    for frame_num, img in frames]
+
+    def assertSameFrames(self, frames, first, last):
+        expected = self.pixels(naiveFrames(self.maker, first, last))
+        got = self.pixels(frames)
+        self.assertEqual([n for n, data in got], range(first, last + 1))
+        for (frame_num, data), (ignored, want) in zip(got, expected):
+            self.assertTrue(data == want, "frame %d differs" % frame_num)
+
+    def testWholeMovie(self):
+        self.assertSameFrames(self.maker.frames(1, 60), 1, 60)
+
+    def testWindow(self):
+        # warmed up for 38, not run from the top
+        self.assertSameFrames(self.maker.frames(38, 52), 38, 52)
+
+    def testWithoutPruning(self):
+        control = self.maker.buildControl()
+        control.pruning = False
+        control.releasing = False
+        self.maker.warmUp(control, 25)
+        self.assertSameFrames(self.maker.frames(25, 45, control), 25, 45)
+
+    def testLoopingIsPerFrame(self):
+        "a looping sequence gives frame n's file whatever was read before"
+        sequence, image = bench.sources(self.directory, 12)
+        read = base.FrameProvider(SIZE, sequence)
+        fresh = base.FrameProvider(SIZE, sequence)
+        read.framePath(30)
+        self.assertEqual(read.framePath(5), fresh.framePath(5))
+        self.assertEqual(read.framePath(15), sequence % 3)
+
+
+if __name__ == '__main__':
+    unittest.main()